@@ -83,6 +83,8 @@ class QC(object):
                  samplesForROISelection=None,
                  autoArtifactDetection=None,
                  artifactDetectionMethod=None,
+                 batchArtifactDetection=None,
+                 artifactDetectionDownscale=None,
 
                  # intensityFilter -
                  numBinsIntensity=None,
@@ -92,6 +94,7 @@ class QC(object):
 
                  # cycleCorrelation -
                  numBinsCorrelation=None,
+                 dnaLossMode='last',
 
                  # pruneOutliers -
                  hexbins=None,
@@ -118,6 +121,7 @@ class QC(object):
                  learningRateUMAPQC=None,
                  minDistQC=None,
                  repulsionStrengthQC=None,
+                 minSamplesQC=None,
 
                  # PCA module —
                  channelExclusionsPCA=None,
@@ -155,6 +159,7 @@ class QC(object):
                  minDist=None,
                  repulsionStrength=None,
                  randomStateUMAP=None,
+                 minSamples=None,
 
                  # frequencyStats —
                  controlGroups=None,
@@ -171,6 +176,9 @@ class QC(object):
         assert topMarkers in ['channels', 'clusters'], \
             'Invalid input for topMarkers configuration parameter.'
 
+        assert dnaLossMode in ['last', 'any', 'monotone'], \
+            'Invalid input for dnaLossMode configuration parameter.'
+
         self.inDir = inDir
         self.outDir = outDir
         self.startModule = startModule
@@ -187,12 +195,15 @@ class QC(object):
         self.samplesForROISelection = samplesForROISelection
         self.autoArtifactDetection = autoArtifactDetection
         self.artifactDetectionMethod = artifactDetectionMethod
+        self.batchArtifactDetection = batchArtifactDetection
+        self.artifactDetectionDownscale = artifactDetectionDownscale
 
         self.numBinsIntensity = numBinsIntensity
 
         self.numBinsArea = numBinsArea
 
         self.numBinsCorrelation = numBinsCorrelation
+        self.dnaLossMode = dnaLossMode
 
         self.hexbins = hexbins
         self.hexbinGridSize = hexbinGridSize
@@ -216,6 +227,7 @@ class QC(object):
         self.learningRateUMAPQC = learningRateUMAPQC
         self.minDistQC = minDistQC
         self.repulsionStrengthQC = repulsionStrengthQC
+        self.minSamplesQC = minSamplesQC
 
         self.channelExclusionsPCA = channelExclusionsPCA
         self.samplesToRemovePCA = samplesToRemovePCA
@@ -249,6 +261,7 @@ class QC(object):
         self.minDist = minDist
         self.repulsionStrength = repulsionStrength
         self.randomStateUMAP = randomStateUMAP
+        self.minSamples = minSamples
 
         self.controlGroups = controlGroups
         self.denominatorCluster = denominatorCluster
@@ -54,12 +54,15 @@ class Config:
         config.samplesForROISelection = list(data['samplesForROISelection'])
         config.autoArtifactDetection = bool(data['autoArtifactDetection'])
         config.artifactDetectionMethod = str(data['artifactDetectionMethod'])
+        config.batchArtifactDetection = bool(data['batchArtifactDetection'])
+        config.artifactDetectionDownscale = int(data['artifactDetectionDownscale'])
 
         config.numBinsIntensity = int(data['numBinsIntensity'])
 
         config.numBinsArea = int(data['numBinsArea'])
 
         config.numBinsCorrelation = int(data['numBinsCorrelation'])
+        config.dnaLossMode = str(data['dnaLossMode'])
 
         config.hexbins = bool(data['hexbins'])
         config.hexbinGridSize = int(data['hexbinGridSize'])
@@ -128,6 +131,15 @@ class Config:
         config.repulsionStrength = float(data['repulsionStrength'])
         config.randomStateUMAP = int(data['randomStateUMAP'])
 
+        if (data['minSamplesQC']) is None:
+            config.minSamplesQC = (data['minSamplesQC'])
+        else:
+            config.minSamplesQC = int(data['minSamplesQC'])
+        if (data['minSamples']) is None:
+            config.minSamples = (data['minSamples'])
+        else:
+            config.minSamples = int(data['minSamples'])
+
         config.controlGroups = list(data['controlGroups'])
         if (data['denominatorCluster']) is None:
             config.denominatorCluster = (data['denominatorCluster'])
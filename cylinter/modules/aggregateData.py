@@ -2,7 +2,9 @@ import logging
 
 import pandas as pd
 
-from ..utils import input_check, read_markers, get_filepath, reorganize_dfcolumns
+from ..utils import (
+    input_check, read_markers, get_filepath, reorganize_dfcolumns, init_provenance
+)
 
 logger = logging.getLogger(__name__)
 
@@ -158,6 +160,9 @@ def aggregateData(data, self, args):
     # assign global index
     data.reset_index(drop=True, inplace=True)
 
+    # start recording which QC stage removes each cell
+    init_provenance(self.outDir, data.index)
+
     # ensure MCMICRO-generated columns come first and
     # are in the same order as csv input
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
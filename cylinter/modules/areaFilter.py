@@ -25,7 +25,8 @@ from qtpy.QtCore import QTimer
 
 from ..utils import (
     input_check, read_markers, napari_notification, 
-    single_channel_pyramid, get_filepath, reorganize_dfcolumns, 
+    single_channel_pyramid, get_filepath, reorganize_dfcolumns, add_centroid_points,
+    update_provenance
 )
 
 logger = logging.getLogger(__name__)
@@ -213,8 +214,8 @@ def callback(self, viewer, sample, samples, data, initial_callback, selection_wi
             if not centroids.empty:
                 if len(viewer.layers) == 3:
                     viewer.layers.pop(2)
-                viewer.add_points(
-                    centroids, name='Area',
+                add_centroid_points(
+                    viewer, centroids, key=(sample, 'Area'), name='Area',
                     properties=point_properties,
                     face_color='cell_area',
                     face_colormap='viridis',
@@ -421,6 +422,7 @@ def areaFilter(data, self, args):
         os.mkdir(plot_dir)
     
     idxs_to_drop = {}
+    drop_reasons = [pd.Series(dtype=np.uint8)]
     for sample in samples:
 
         group = data[data['Sample'] == sample]
@@ -505,6 +507,12 @@ def areaFilter(data, self, args):
 
             # add IDs to idxs_to_drop dictionary
             idxs_to_drop[sample] = data_to_drop['handle']
+
+            # record cells as below (1) or above (2) cutoffs
+            drop_reasons.append(pd.Series(
+                np.where(np.log(data_to_drop['Area']) < lowerCutoff, 1, 2),
+                index=data_to_drop.index, dtype=np.uint8
+            ))
         else:
             idxs_to_drop[sample] = pd.Series()
     
@@ -522,6 +530,8 @@ def areaFilter(data, self, args):
     # drop unique ID column
     data.drop(columns='handle', inplace=True)
 
+    update_provenance(self.outDir, 'areaFilter', pd.concat(drop_reasons))
+
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
     print()
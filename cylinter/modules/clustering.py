@@ -25,8 +25,6 @@ from matplotlib.backends.backend_qt5agg import (
 
 from umap import UMAP
 from sklearn.manifold import TSNE
-import hdbscan
-from joblib import Memory
 
 from sklearn.metrics import silhouette_samples, silhouette_score
 
@@ -36,12 +34,29 @@ import napari
 from ..utils import (
     input_check, read_markers, matplotlib_warnings, categorical_cmap, SelectFromCollection, 
     cluster_expression, napari_notification, marker_channel_number, single_channel_pyramid, 
-    log_banner, log_multiline, get_filepath, reorganize_dfcolumns
+    log_banner, log_multiline, get_filepath, reorganize_dfcolumns, hdbscan_labels, mcs_sweep,
+    embedding_key, load_embedding, save_embedding, knn_graph
 )
 
 logger = logging.getLogger(__name__)
 
 
+def plot_mcs_sweep(sweep, path):
+    """Plot number of clusters, noise fraction and silhouette estimate
+    against minimum cluster size."""
+    fig, axes = plt.subplots(3, 1, figsize=(5, 6), sharex=True)
+    for ax, (col, label) in zip(axes, [
+            ('clusters', 'Clusters'), ('noise_fraction', 'Noise fraction'),
+            ('silhouette', 'Silhouette score')]):
+        ax.plot(sweep['MCS'], sweep[col], marker='o', ms=2, lw=0.75, color='k')
+        ax.set_ylabel(label, fontsize=7)
+        ax.tick_params(labelsize=6)
+    axes[-1].set_xlabel('Min cluster size (MCS)', fontsize=7)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close(fig)
+
+
 def clustering(data, self, args):
 
     print()
@@ -100,39 +115,33 @@ def clustering(data, self, args):
     print(data[abx_channels])
     print()
 
-    # if embedding has already been computed
-    if os.path.exists(os.path.join(dim_dir, 'embedding.npy')):
-
-        embedding = np.load(os.path.join(dim_dir, 'embedding.npy'))
-
-        if embedding.shape[1] == 2:
-            try:
-                data['emb1'] = embedding[:, 0]
-                data['emb2'] = embedding[:, 1]
-                clustering_input = data[['emb1', 'emb2']]
-            except ValueError:
-                logger.info(
-                    'Aborting; the number of rows in the dataframe differs from embedding.npy. '
-                    'Ensure that the dataframe contains the same cells referred to in the ' 
-                    'embedding or re-embed the current dataframe after removing the existing '
-                    'embedding.'
-                )
-                sys.exit()
-
-        elif embedding.shape[1] == 3:
-            try:
-                data['emb1'] = embedding[:, 0]
-                data['emb2'] = embedding[:, 1]
-                data['emb3'] = embedding[:, 2]
-                clustering_input = data[['emb1', 'emb2', 'emb3']]
-            except ValueError:
-                logger.info(
-                    'Aborting; the number of rows in the dataframe differs from the embedding. '
-                    'Ensure that the dataframe contains the same cells referred to in the ' 
-                    'embedding or re-embed the current dataframe after removing the existing '
-                    'embedding.'
-                )
-                sys.exit()
+    # identify the embedding by its input data, sampling and algorithm parameters
+    emb_params = {
+        'embeddingAlgorithm': self.embeddingAlgorithm,
+        'dimensionEmbedding': self.dimensionEmbedding,
+        'samplesToRemoveClustering': list(self.samplesToRemoveClustering),
+        'normalizeTissueCounts': self.normalizeTissueCounts,
+        'fracForEmbedding': self.fracForEmbedding,
+        'samplingRandomState': random_state,
+    }
+    if self.embeddingAlgorithm == 'TSNE':
+        emb_params.update({
+            'perplexity': self.perplexity, 'earlyExaggeration': self.earlyExaggeration,
+            'learningRateTSNE': self.learningRateTSNE, 'metric': self.metric,
+            'randomStateTSNE': self.randomStateTSNE
+        })
+    elif self.embeddingAlgorithm == 'UMAP':
+        emb_params.update({
+            'nNeighbors': self.nNeighbors, 'learningRateUMAP': self.learningRateUMAP,
+            'metric': self.metric, 'minDist': self.minDist,
+            'repulsionStrength': self.repulsionStrength, 'randomStateUMAP': self.randomStateUMAP
+        })
+    emb_key = embedding_key(data, abx_channels, emb_params)
+
+    # if this embedding has already been computed
+    embedding = load_embedding(dim_dir, emb_key)
+    if embedding is not None:
+        logger.info(f'Using cached embedding {emb_key[:12]}.')
 
     else:
         # exit program if dimensionEmbedding configuration is not 2 or 3
@@ -155,6 +164,15 @@ def clustering(data, self, args):
                 init='pca', n_jobs=-1).fit_transform(data[abx_channels])
 
         elif self.embeddingAlgorithm == 'UMAP':
+            # k-NN graph shared by all layouts of the same input
+            knn_key = embedding_key(
+                data, abx_channels,
+                {'nNeighbors': self.nNeighbors, 'randomStateUMAP': self.randomStateUMAP}
+            )
+            knn, umap_random_state = knn_graph(
+                data[abx_channels], dim_dir, knn_key, self.nNeighbors, self.randomStateUMAP
+            )
+
             print('Computing UMAP embedding.')
             embedding = UMAP(
                 n_components=self.dimensionEmbedding,
@@ -163,8 +181,9 @@ def clustering(data, self, args):
                 output_metric=self.metric,
                 min_dist=self.minDist,
                 repulsion_strength=self.repulsionStrength,
-                random_state=self.randomStateUMAP,
+                random_state=umap_random_state,
                 n_epochs=1000,
+                precomputed_knn=knn,
                 init='spectral',
                 metric='euclidean',
                 metric_kwds=None,
@@ -197,19 +216,19 @@ def clustering(data, self, args):
 
         logger.info('Embedding completed in ' + str(datetime.now() - startTime))
 
-        np.save(os.path.join(dim_dir, 'embedding'), embedding)
+        save_embedding(dim_dir, emb_key, embedding, emb_params)
+        print()
 
-        if embedding.shape[1] == 2:
-            data['emb1'] = embedding[:, 0]
-            data['emb2'] = embedding[:, 1]
-            clustering_input = data[['emb1', 'emb2']]
+    if embedding.shape[1] == 2:
+        data['emb1'] = embedding[:, 0]
+        data['emb2'] = embedding[:, 1]
+        clustering_input = data[['emb1', 'emb2']]
 
-        elif embedding.shape[1] == 3:
-            data['emb1'] = embedding[:, 0]
-            data['emb2'] = embedding[:, 1]
-            data['emb3'] = embedding[:, 2]
-            clustering_input = data[['emb1', 'emb2', 'emb3']]
-        print()
+    elif embedding.shape[1] == 3:
+        data['emb1'] = embedding[:, 0]
+        data['emb2'] = embedding[:, 1]
+        data['emb3'] = embedding[:, 2]
+        clustering_input = data[['emb1', 'emb2', 'emb3']]
 
     # show abx intensity for each marker on UMAP embedding
     if not os.path.exists(os.path.join(dim_dir, 'emb_channels.png')):
@@ -288,29 +307,19 @@ def clustering(data, self, args):
         )
         def cluster_and_plot(MCS: int = 200):
 
-            clustering = hdbscan.HDBSCAN(
-                min_cluster_size=MCS,
-                min_samples=None,
-                metric='euclidean', alpha=1.0, p=None,
-                algorithm='best', leaf_size=40,
-                memory=Memory(location=None),
-                approx_min_span_tree=True,
-                gen_min_span_tree=False,
-                core_dist_n_jobs=-1,
-                cluster_selection_method='eom',
-                allow_single_cluster=False,
-                prediction_data=False,
-                match_reference_implementation=False).fit(clustering_input)
+            labels = hdbscan_labels(
+                clustering_input, dim_dir, MCS, self.minSamples
+            )
 
-            data[f'cluster_{self.dimensionEmbedding}d'] = clustering.labels_
+            data[f'cluster_{self.dimensionEmbedding}d'] = labels
 
-            logger.info(f'min_cluster_size = {MCS} {np.unique(clustering.labels_)}')
+            logger.info(f'min_cluster_size = {MCS} {np.unique(labels)}')
 
             ###################################################
             # plot silhouette scores
 
             silho_input = clustering_input.copy()
-            silho_input[f'cluster_{self.dimensionEmbedding}d'] = clustering.labels_
+            silho_input[f'cluster_{self.dimensionEmbedding}d'] = labels
             silho_input = silho_input[
                 silho_input[f'cluster_{self.dimensionEmbedding}d'] != -1
             ]
@@ -1120,53 +1129,20 @@ def clustering(data, self, args):
                 range(lowerMCS, upperMCS + 1, 1))
 
             print()
-            for i in rnge:
-
-                clustering = hdbscan.HDBSCAN(
-                    min_cluster_size=i,
-                    min_samples=None,
-                    metric='euclidean', alpha=1.0, p=None,
-                    algorithm='best', leaf_size=40,
-                    memory=Memory(
-                        location=None),
-                    approx_min_span_tree=True,
-                    gen_min_span_tree=False,
-                    core_dist_n_jobs=-1,
-                    cluster_selection_method='eom',
-                    allow_single_cluster=False,
-                    prediction_data=False,
-                    match_reference_implementation=False).fit(
-                        clustering_input)
-
-                data[f'cluster_{self.dimensionEmbedding}d'] = clustering.labels_
-
-                logger.info(f'min_cluster_size = {i} {np.unique(clustering.labels_)}')
-
-                silho_input = clustering_input.copy()
-                silho_input[f'cluster_{self.dimensionEmbedding}d'] = clustering.labels_
-                silho_input = silho_input[
-                    silho_input[f'cluster_{self.dimensionEmbedding}d'] != -1
-                ]
-
-                # subsample clustered data for silhouette analysis
-                silho_subset = silho_input.head(50000)
-
-                embed_cols = [i for i in silho_subset.columns if 'emb' in i]
-
-                silhouette_avg = silhouette_score(
-                    silho_subset[embed_cols], silho_subset[f'cluster_{self.dimensionEmbedding}d']
-                )
+            logger.info(f'Sweeping min_cluster_size over {lowerMCS}-{upperMCS}...')
 
-                total_clusters = len(silho_input[f'cluster_{self.dimensionEmbedding}d'].unique())
+            sweep = mcs_sweep(
+                clustering_input, dim_dir, rnge, min_samples=self.minSamples
+            )
 
-                n_clusters = len(silho_subset[f'cluster_{self.dimensionEmbedding}d'].unique())
+            sweep.to_csv(os.path.join(dim_dir, 'mcs_sweep.csv'), index=False)
+            plot_mcs_sweep(sweep, os.path.join(dim_dir, 'mcs_sweep.pdf'))
 
-                logger.info(
-                    ('Average silhouette score for %d/%d clusters in '
-                     'silhouette data subset: %f'
-                     % (n_clusters, total_clusters, silhouette_avg))
-                )
-                print()
+            log_multiline(logger.info, sweep.to_string(index=False))
+            napari_notification(
+                f"MCS sweep saved to {os.path.join(dim_dir, 'mcs_sweep.csv')}"
+            )
+            print()
 
         ##########################################################################################
 
@@ -1197,20 +1173,10 @@ def clustering(data, self, args):
 
     logger.info(f'Applying saved minimum cluster size: {final_mcs_entry}')
 
-    clustering = hdbscan.HDBSCAN(
-        min_cluster_size=final_mcs_entry,
-        min_samples=None,
-        metric='euclidean', alpha=1.0, p=None,
-        algorithm='best', leaf_size=40,
-        memory=Memory(location=None),
-        approx_min_span_tree=True,
-        gen_min_span_tree=False,
-        core_dist_n_jobs=-1,
-        cluster_selection_method='eom',
-        allow_single_cluster=False,
-        prediction_data=False,
-        match_reference_implementation=False).fit(clustering_input)
-    data[f'cluster_{self.dimensionEmbedding}d'] = clustering.labels_
+    labels = hdbscan_labels(
+        clustering_input, dim_dir, final_mcs_entry, self.minSamples
+    )
+    data[f'cluster_{self.dimensionEmbedding}d'] = labels
 
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
@@ -14,6 +14,7 @@ from matplotlib.backends.qt_compat import QtWidgets
 from matplotlib.widgets import Slider, Button
 from matplotlib.figure import Figure
 from matplotlib.lines import Line2D
+from matplotlib.colors import to_rgb
 from matplotlib.backends.backend_qt5agg import (
     FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 )
@@ -25,7 +26,8 @@ from magicgui import magicgui
 
 from ..utils import (
     input_check, read_markers, napari_notification, marker_channel_number,
-    single_channel_pyramid, categorical_cmap, get_filepath, reorganize_dfcolumns
+    single_channel_pyramid, categorical_cmap, get_filepath, reorganize_dfcolumns,
+    add_centroid_points, update_provenance
 )
 
 logger = logging.getLogger(__name__)
@@ -34,7 +36,27 @@ arbitrary_selection_toggle = False
 sample_index = 1
 
 
-def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback, selection_widget, selection_layout, hist_widget, hist_layout, cycles_dir): 
+def first_loss_cycle(log_ratios, lower, upper, monotone=False):
+    """Return, per cell, the position of the first cycle at which its
+    log10(DNA1/DNAn) ratio leaves the (lower, upper) cutoff window, or -1.
+
+    log_ratios is a (cells, cycles) array; lower and upper broadcast against
+    it (e.g., per-cycle arrays). If monotone, only excursions that persist
+    through the last cycle count as loss.
+    """
+    outside = (log_ratios < lower) | (log_ratios > upper)
+    if monotone:
+        outside = np.logical_and.accumulate(outside[:, ::-1], axis=1)[:, ::-1]
+    return np.where(outside.any(axis=1), outside.argmax(axis=1), -1)
+
+
+def cycle_window(cutoffs_dict, cycle_cutoffs, sample, cycle):
+    """Return a sample's (lower, upper) cutoffs for a cycle, falling back to
+    the cutoffs gated on the last cycle."""
+    return cycle_cutoffs.get(sample, {}).get(cycle, cutoffs_dict.get(sample))
+
+
+def callback(self, viewer, sample, samples, data, sample_ratios, initial_callback, selection_widget, selection_layout, hist_widget, hist_layout, cycles_dir, cycle=None): 
     
     if sample in data['Sample'].unique():
         
@@ -50,15 +72,11 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
         # clear existing channels from Napari window if they exist
         viewer.layers.clear()
 
-        # isolate sample data
-        group = ratios_melt[ratios_melt['sample'] == sample]
-        
-        # loop over last cycle only
-        cycle_ratio = group['cycle'].unique()[-1]
-
-        # isolate ratio data
-        cycle_data = group[group['cycle'] == cycle_ratio]
-        cycle_num = cycle_ratio.split('/')[1]
+        # isolate ratio data of the selected cycle (last cycle by default)
+        dna_cycles = natsorted(data.columns[data.columns.str.contains(dna_moniker)])
+        if cycle is None:
+            cycle = dna_cycles[-1]
+        cycle_num, rows, log_ratios = sample_ratios(sample, cycle)
 
         # add cell segmentation outlines to Napari viewer
         file_path = get_filepath(self, check, sample, 'SEG')
@@ -127,7 +145,7 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
 
         # plot log(cycle 1/n) histogram for current sample
         counts, bins, patches = ax.hist(
-            cycle_data['log10(ratio)'], bins=self.numBinsCorrelation,
+            log_ratios, bins=self.numBinsCorrelation,
             density=False, color='grey', ec='none', alpha=0.75,
             histtype='stepfilled', range=None, label='before'
         )
@@ -153,13 +171,20 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
         else:
             # create cutoffs dictionary
             cutoffs_dict = {}
+
+        # cutoffs for cycles other than the last one
+        if os.path.exists(os.path.join(cycles_dir, 'cycle_cutoffs.pkl')):
+            f = open(os.path.join(cycles_dir, 'cycle_cutoffs.pkl'), 'rb')
+            cycle_cutoffs = pickle.load(f)
+        else:
+            cycle_cutoffs = {}
             
         try:
-            lowerCutoff, upperCutoff = cutoffs_dict[sample]
+            lowerCutoff, upperCutoff = cycle_window(cutoffs_dict, cycle_cutoffs, sample, cycle)
             vbars = True  # toggle to show vertical red/blue bars on plot
             if lowerCutoff == upperCutoff:
                 vbars = False  # cutoffs were negated
-        except KeyError:
+        except (KeyError, TypeError):
             lowerCutoff, upperCutoff = (0.0001, 0.0001)  # avoiding -0.000 for initial slider vals
             vbars = False
 
@@ -213,26 +238,18 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
             # get current cutoffs
             lowerCutoff, upperCutoff = update(val=None)
 
-            # get indices in log(ratio) series outside
-            # lower and upper cutoffs
-            idxs = list(
-                cycle_data['index'][
-                    (cycle_data['log10(ratio)'] < lowerCutoff) |
-                    (cycle_data['log10(ratio)'] > upperCutoff)])
+            # flag log(ratio) values outside lower and upper cutoffs
+            drop = (log_ratios < lowerCutoff) | (log_ratios > upperCutoff)
 
-            # filter group data by selecting
-            # indices NOT in idxs
-            sample_data = data[data['Sample'] == sample]
-            drop_df = sample_data.index.isin(idxs)
-            centroids = sample_data[
-                ['Y_centroid', 'X_centroid']][~drop_df]
+            # select centroids of cells NOT flagged
+            centroids = data[['Y_centroid', 'X_centroid']].iloc[rows[~drop]]
 
             # remove existing centroids and plot new centroid selection in Napari window
             if not centroids.empty:
                 if len(viewer.layers) == 4:
                     viewer.layers.pop(3)
-                viewer.add_points(
-                    centroids,
+                add_centroid_points(
+                    viewer, centroids, key=(sample, 'Selected Cells'),
                     name='Selected Cells',
                     properties=None,
                     face_color='yellow',
@@ -245,6 +262,19 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
         # maintain reference to button after exiting callback()
         button_ax._button = button
         
+        def store_cutoffs(lowerCutoff, upperCutoff):
+            # the last cycle's cutoffs double as defaults for the other cycles
+            if cycle == dna_cycles[-1]:
+                cutoffs_dict[sample] = (lowerCutoff, upperCutoff)
+                f = open(os.path.join(cycles_dir, 'cutoffs.pkl'), 'wb')
+                pickle.dump(cutoffs_dict, f)
+                f.close()
+            else:
+                cycle_cutoffs.setdefault(sample, {})[cycle] = (lowerCutoff, upperCutoff)
+                f = open(os.path.join(cycles_dir, 'cycle_cutoffs.pkl'), 'wb')
+                pickle.dump(cycle_cutoffs, f)
+                f.close()
+
         # dock (or re-dock) hist_widget to Napari window 
         viewer.window.add_dock_widget(
             hist_widget, name=f'Log(DNA1/{cycle_num}) histogram', area='right'
@@ -275,10 +305,7 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
             if lowerCutoff <= upperCutoff:
             
                 # add cutoffs to dictionary and store
-                cutoffs_dict[sample] = (lowerCutoff, upperCutoff)
-                f = open(os.path.join(cycles_dir, 'cutoffs.pkl'), 'wb')
-                pickle.dump(cutoffs_dict, f)
-                f.close()
+                store_cutoffs(lowerCutoff, upperCutoff)
 
                 # go to next sample
                 try:
@@ -289,7 +316,7 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
                     
                     initial_callback = False
                     callback(
-                        self, viewer, sample, samples, data, ratios_melt, initial_callback,
+                        self, viewer, sample, samples, data, sample_ratios, initial_callback,
                         selection_widget, selection_layout, hist_widget, hist_layout,
                         cycles_dir 
                     )
@@ -318,6 +345,35 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
         next_sample.sample.bind(sample)
 
         hist_layout.addWidget(next_sample.native)
+
+        ###########################################################################
+
+        # per-cycle gating when cells are filtered on more than the last cycle
+        if self.dnaLossMode != 'last':
+
+            @magicgui(
+                layout='horizontal', call_button='View Cycle',
+                cycle_name={'label': 'Cycle', 'choices': dna_cycles[1:] or dna_cycles}
+            )
+            def cycle_selector(cycle_name: str = cycle):
+
+                # store cutoffs of the current cycle before switching
+                lowerCutoff, upperCutoff = update(val=None)
+                if lowerCutoff <= upperCutoff:
+                    store_cutoffs(lowerCutoff, upperCutoff)
+
+                callback(
+                    self, viewer, sample, samples, data, sample_ratios, False,
+                    selection_widget, selection_layout, hist_widget, hist_layout,
+                    cycles_dir, cycle_name
+                )
+
+            cycle_selector.native.setSizePolicy(
+                QtWidgets.QSizePolicy.Maximum,
+                QtWidgets.QSizePolicy.Maximum,
+            )
+
+            hist_layout.addWidget(cycle_selector.native)
         
         ###########################################################################
 
@@ -347,7 +403,7 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
 
             initial_callback = False
             callback(
-                self, viewer, sample, samples, data, ratios_melt, initial_callback,
+                self, viewer, sample, samples, data, sample_ratios, initial_callback,
                 selection_widget, selection_layout, hist_widget, hist_layout,
                 cycles_dir
             )
@@ -363,6 +419,70 @@ def callback(self, viewer, sample, samples, data, ratios_melt, initial_callback,
         pass
 
 
+def binned_correlations(data, dna1, dna_cycles, samples, bins=300):
+    """Bin DNA1 against each DNA cycle in 2D, per sample.
+
+    Returns
+    -------
+    counts : ndarray
+        (samples, cycles, bins, bins) cell counts indexed [.., y, x].
+    extents : list of tuples
+        (xmin, xmax, ymin, ymax) bin extent per cycle; the x range (DNA1)
+        is shared by all cycles.
+    """
+    sample_ids = pd.Categorical(data['Sample'], categories=samples).codes
+    x = data[dna1].to_numpy()
+    x_range = (np.nanmin(x), np.nanmax(x))
+
+    counts = np.zeros((len(samples), len(dna_cycles), bins, bins), dtype=np.float32)
+    extents = []
+    for i, cycle in enumerate(dna_cycles):
+        y = data[cycle].to_numpy()
+        y_range = (np.nanmin(y), np.nanmax(y))
+        hist, edges = np.histogramdd(
+            (sample_ids, y, x), bins=(len(samples), bins, bins),
+            range=((-0.5, len(samples) - 0.5), y_range, x_range)
+        )
+        counts[:, i] = hist
+        extents.append((edges[2][0], edges[2][-1], edges[1][0], edges[1][-1]))
+    return counts, extents
+
+
+def plot_correlation_facets(counts, extents, titles, colors, path, legend_elements=None):
+    """Save a grid of binned DNA1 vs. DNAn plots, one facet per cycle.
+
+    counts is (cycles, bins, bins) for a single color, or (groups, cycles,
+    bins, bins) with one color per group; bins are colored by the count-weighted
+    mean group color, and their opacity scales with log cell density.
+    """
+    counts = counts.reshape((-1,) + counts.shape[-3:])
+    colors = np.asarray(colors, dtype=float)[:, :3]
+    totals = counts.sum(axis=0)
+    rgb = np.einsum('gcyx,gk->cyxk', counts, colors) / np.maximum(totals, 1)[..., None]
+
+    num_cols = min(len(titles), 5)
+    num_rows = int(np.ceil(len(titles) / 5))
+    fig, axes = plt.subplots(
+        num_rows, num_cols, figsize=(3 * num_cols, 3 * num_rows), sharex=True,
+        squeeze=False
+    )
+    for ax, cycle_rgb, total, extent, title in zip(axes.flat, rgb, totals, extents, titles):
+        alpha = np.log1p(total) / max(np.log1p(total).max(), 1e-12)
+        ax.imshow(
+            np.dstack([cycle_rgb, alpha]), origin='lower', extent=extent,
+            aspect='auto', interpolation='nearest'
+        )
+        ax.set_title(f'cycle = {title}')
+    for ax in axes.flat[len(titles):]:
+        ax.set_visible(False)
+
+    if legend_elements:
+        fig.legend(handles=legend_elements, bbox_to_anchor=(1.1, 1.05))
+
+    plt.savefig(path, dpi=600, bbox_inches='tight')
+    plt.close('all')
+
+
 def cycleCorrelation(data, self, args):
 
     check, markers_filepath = input_check(self)
@@ -381,43 +501,29 @@ def cycleCorrelation(data, self, args):
     # get ordered list of DNA cycles
     dna_cycles = natsorted(data.columns[data.columns.str.contains(dna_moniker)])
 
-    # compute DNA ratios
-    ratios = pd.DataFrame(
-        [np.log10((data[dna1] + 0.00000000001) / (data[i] + 0.00000000001))
-         for i in dna_cycles]).T
-
-    # computing ratios changes columns headers,
-    # create new ratio column headers
-    unnamed_headers = [
-        i for i in ratios.columns if i.startswith('Unnamed')]
-    ratio_headers = [f'{dna1}/{i}' for i in [j for j in dna_cycles[1:]]]
-    ratio_columns = dict(zip(unnamed_headers, ratio_headers))
-    ratio_columns[dna1] = f'{dna1}/{dna1}'
-    ratios.rename(columns=ratio_columns, inplace=True)
-    ratios['sample'] = data['Sample']
-
-    # melt ratios dataframe
-    ratios_melt = (
-        ratios
-        .reset_index()
-        .melt(id_vars=['sample', 'index'], var_name='cycle',
-              value_name='log10(ratio)'))
-
-    # convert sample and cycle columns to ordered categoricals
-    # and sort naturally on sample, cycle, and index
-    ratios_melt['sample'] = pd.Categorical(
-        ratios_melt['sample'], ordered=True,
-        categories=natsorted(
-            ratios_melt['sample'].unique()))
-    ratios_melt['cycle'] = pd.Categorical(
-        ratios_melt['cycle'], ordered=True,
-        categories=natsorted(
-            ratios_melt['cycle'].unique()))
-    ratios_melt = ratios_melt.sort_values(['sample', 'cycle', 'index'])
-
-    # convert columns back to strings
-    ratios_melt['sample'] = ratios_melt['sample'].astype('str')
-    ratios_melt['cycle'] = ratios_melt['cycle'].astype('str')
+    # row positions of each sample's cells
+    sample_rows = data.groupby('Sample', sort=False).indices
+
+    # cycles on which cells are filtered
+    loss_cycles = dna_cycles[-1:] if self.dnaLossMode == 'last' else (
+        dna_cycles[1:] or dna_cycles
+    )
+
+    def sample_ratios(sample, cycle=dna_cycles[-1]):
+        # log10(DNA1/DNAn) ratios for one sample, aligned with sample_rows[sample]
+        rows = sample_rows[sample]
+        first = data[dna1].to_numpy()[rows]
+        last = data[cycle].to_numpy()[rows]
+        return cycle, rows, np.log10((first + 0.00000000001) / (last + 0.00000000001))
+
+    def sample_ratio_matrix(sample):
+        # log10(DNA1/DNAn) ratios for one sample (cells x loss_cycles)
+        rows = sample_rows[sample]
+        first = data[dna1].to_numpy()[rows]
+        cycles = data[loss_cycles].iloc[rows].to_numpy()
+        return rows, np.log10(
+            (first[:, None] + 0.00000000001) / (cycles + 0.00000000001)
+        )
 
     ##########################################################
     
@@ -446,7 +552,7 @@ def cycleCorrelation(data, self, args):
     
     initial_callback = True
     callback(
-        self, viewer, sample, samples, data, ratios_melt, initial_callback,
+        self, viewer, sample, samples, data, sample_ratios, initial_callback,
         selection_widget, selection_layout, hist_widget, hist_layout,
         cycles_dir
     )
@@ -482,26 +588,28 @@ def cycleCorrelation(data, self, args):
     if not os.path.exists(plot_dir):
         os.mkdir(plot_dir)
     
-    idxs_to_drop = {}
+    if os.path.exists(os.path.join(cycles_dir, 'cycle_cutoffs.pkl')):
+        f = open(os.path.join(cycles_dir, 'cycle_cutoffs.pkl'), 'rb')
+        cycle_cutoffs = pickle.load(f)
+    else:
+        cycle_cutoffs = {}
+
+    keep = np.ones(len(data), dtype=bool)
+    loss_counts = []
+
+    # provenance reason codes: 1-based position of the cycle at which DNA was lost
+    reasons = np.zeros(len(data), dtype=np.uint8)
+    cycle_codes = np.array([dna_cycles.index(cycle) + 1 for cycle in loss_cycles], dtype=np.uint8)
     for sample in samples:
 
-        # isolate sample data
-        group = ratios_melt[ratios_melt['sample'] == sample]
-        
-        # loop over last cycle only
-        cycle_ratio = group['cycle'].unique()[-1]
-        cycle_num = cycle_ratio.split('/')[1]
-        
-        # isolate ratio data
-        cycle_data = group[group['cycle'] == cycle_ratio]
+        # isolate ratio data of all filtered cycles; the last one is plotted
+        rows, ratio_matrix = sample_ratio_matrix(sample)
+        cycle_num, log_ratios = loss_cycles[-1], ratio_matrix[:, -1]
 
         try:
             lowerCutoff, upperCutoff = cutoffs_dict[sample]
             if lowerCutoff == upperCutoff:
                 logger.info(f'All data points selected for sample {sample}.')      
-                # select all data points if sliders were not adjusted
-                lowerCutoff = cycle_data['log10(ratio)'].min()
-                upperCutoff = cycle_data['log10(ratio)'].max()
             else:
                 logger.info(
                     f'Applying cutoffs ({lowerCutoff:.3f}, '
@@ -522,23 +630,32 @@ def cycleCorrelation(data, self, args):
 
         # plot DNA ratio histogram BEFORE filtering
         counts, bins, patches = plt.hist(
-            cycle_data['log10(ratio)'], bins=self.numBinsCorrelation,
+            log_ratios, bins=self.numBinsCorrelation,
             density=False, color='b', ec='none', alpha=0.5,
             histtype='stepfilled', range=None, label='before'
         )
 
-        # apply lower and upper cutoffs
-        idxs = list(
-            cycle_data['index'][
-                (cycle_data['log10(ratio)'] < lowerCutoff) |
-                (cycle_data['log10(ratio)'] > upperCutoff)]
-        )
+        # apply lower and upper cutoffs of every filtered cycle
+        windows = np.array([
+            cycle_window(cutoffs_dict, cycle_cutoffs, sample, cycle) for cycle in loss_cycles
+        ], dtype=float)
+
+        # select all data points of cycles whose sliders were not adjusted
+        windows[windows[:, 0] == windows[:, 1]] = (-np.inf, np.inf)
 
-        cycle_data_filtered = cycle_data[~cycle_data['index'].isin(idxs)]
+        loss = first_loss_cycle(
+            ratio_matrix, windows[:, 0], windows[:, 1],
+            monotone=self.dnaLossMode == 'monotone'
+        )
+        drop = loss >= 0
+        loss_counts.append(pd.DataFrame({
+            'Sample': sample, 'cycle': loss_cycles,
+            'count': np.bincount(loss[drop], minlength=len(loss_cycles))
+        }))
 
         # plot DNA ratio histogram AFTER filtering
         counts, bins, patches = plt.hist(
-            cycle_data_filtered['log10(ratio)'], bins=bins,
+            log_ratios[~drop], bins=bins,
             density=False, color='r', ec='none', alpha=0.5,
             histtype='stepfilled', range=None, label='before'
         )
@@ -569,98 +686,48 @@ def cycleCorrelation(data, self, args):
         plt.savefig(os.path.join(plot_dir, f'{sample}.pdf'))
         plt.close('all')
 
-        idxs_to_drop[sample] = idxs
+        keep[rows[drop]] = False
+        reasons[rows[drop]] = cycle_codes[loss[drop]]
+
+    # number of cells dropped per sample by the cycle at which they were lost
+    pd.concat(loss_counts).to_csv(os.path.join(cycles_dir, 'loss_cycles.csv'), index=False)
+
+    update_provenance(
+        self.outDir, 'cycleCorrelation', pd.Series(reasons[~keep], index=data.index[~keep])
+    )
 
     # filter cells from all samples
-    indices_to_drop = set()
-    for k, v in idxs_to_drop.items():
-        for idx in v:
-            indices_to_drop.update(set([idx]))
-    data = data.loc[~data.index.isin(indices_to_drop)]
+    data = data[keep]
     
     print()
 
     logger.info('Plotting cycle correlation graphs')
     
-    # grab dna and sample columns of filtered dataframe
-    facet_input = data.loc[:, data.columns.str.contains(f'{dna_moniker}|Sample')].copy()
-
-    # melt filtered dataframe
-    facet_per_cycle_melt = (
-        facet_input
-        .sample(frac=1.0)
-        .reset_index()
-        .melt(id_vars=['Sample', 'index'], var_name='cycle'))
-
-    # convert sample and cycle columns to ordered categorical
-    # with sorted catgories by natsorted
-    facet_per_cycle_melt['Sample'] = pd.Categorical(
-        facet_per_cycle_melt['Sample'], ordered=True,
-        categories=natsorted(
-            facet_per_cycle_melt['Sample'].unique()))
-    facet_per_cycle_melt['cycle'] = pd.Categorical(
-        facet_per_cycle_melt['cycle'], ordered=True,
-        categories=natsorted(
-            facet_per_cycle_melt['cycle'].unique()))
-
-    # sort melt on sample, cycle, and index
-    facet_per_cycle_melt = facet_per_cycle_melt.sort_values(
-        ['Sample', 'cycle', 'index'])
+    # bin DNA1 against every DNA cycle once per sample; plot time and memory
+    # then depend on the number of bins rather than the number of cells
+    samples = natsorted(data['Sample'].unique())
+    counts, extents = binned_correlations(data, dna1, dna_cycles, samples)
 
     # plot dna intensity correlation per cycle
-    fig, ax = plt.subplots(figsize=(5, 5))
-
-    g = sns.FacetGrid(
-        facet_per_cycle_melt, col='cycle', col_wrap=5,
-        sharex=True, sharey=False
+    plot_correlation_facets(
+        counts.sum(axis=0), extents, dna_cycles, [to_rgb('r')],
+        os.path.join(plot_dir, 'correlation.png')
     )
 
-    g.map(
-        lambda y, color: plt.scatter(
-            facet_per_cycle_melt['value'].loc[
-                facet_per_cycle_melt['cycle'] == dna1], y, s=0.15,
-            linewidth=0.0, marker='o', c='r'), 'value'
-    )
-    g.set(xlabel=None)
-    g.set(ylabel=None)
-    
-    plt.savefig(os.path.join(plot_dir, 'correlation.png'), dpi=600, bbox_inches='tight')
-    plt.close('all')
-
     # plot dna intensity correlation per cycle (color by sample)
-    fig, ax = plt.subplots(figsize=(5, 5))
-
-    # build cmap
     cmap = categorical_cmap(
-        numUniqueSamples=len(facet_per_cycle_melt['Sample'].unique()),
-        numCatagories=10, cmap='tab10', continuous=False
+        numUniqueSamples=len(samples), numCatagories=10, cmap='tab10', continuous=False
     )
-
-    sample_color_dict = dict(zip(
-        natsorted(facet_per_cycle_melt['Sample'].unique()), cmap.colors))
-
-    g = sns.FacetGrid(
-        facet_per_cycle_melt, col='cycle', hue='Sample',
-        col_wrap=5, sharex=True, sharey=False
-    )
-
-    g.map(
-        lambda sam, y, color, **kwargs: plt.scatter(
-            facet_per_cycle_melt.loc[
-                (facet_per_cycle_melt['Sample'] == sam.unique()[0])
-                & (facet_per_cycle_melt['cycle'] == dna1), 'value'], y,
-            c=np.reshape(sample_color_dict[sam.unique()[0]], (-1, 3)),
-            s=0.15, linewidth=0.0, marker='o', **kwargs), 'Sample', 'value'
+    sample_colors = list(cmap.colors)[:len(samples)]
+    legend_elements = [
+        Line2D([0], [0], marker='o', color='none', label=sample,
+               markerfacecolor=color, markeredgecolor='none', markersize=8)
+        for sample, color in zip(samples, sample_colors)
+    ]
+    plot_correlation_facets(
+        counts, extents, dna_cycles, sample_colors,
+        os.path.join(plot_dir, 'correlation(sample).png'), legend_elements
     )
-    g.set(xlabel=None)
-    g.set(ylabel=None)
-    
-    plt.legend(markerscale=10, bbox_to_anchor=(1.1, 1.05))
-
-    plt.savefig(
-        os.path.join(plot_dir, 'correlation(sample).png'), dpi=600, bbox_inches='tight'
-    )
-    plt.close('all')
 
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
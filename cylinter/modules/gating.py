@@ -33,7 +33,7 @@ from magicgui import magicgui
 
 from ..utils import (
     input_check, read_markers, single_channel_pyramid, marker_channel_number, napari_notification,
-    log_banner, log_multiline, get_filepath, reorganize_dfcolumns
+    log_banner, log_multiline, get_filepath, reorganize_dfcolumns, add_centroid_points
 )
 
 from ..config import BooleanTerm
@@ -268,9 +268,9 @@ def callback(self, viewer, data, zeros, hist_widget, hist_layout, selection_widg
             centroids = sample_data[['Y_centroid', 'X_centroid']][
                 sample_data[marker] > current_gate]
 
-            viewer.add_points(
-                centroids, name='Reference gate', face_color='#00aaff', 
-                edge_color='#00aaff', edge_width=0.0, size=7.0, opacity=1.0,
+            add_centroid_points(
+                viewer, centroids, key=(sample, 'Reference gate'), name='Reference gate',
+                face_color='#00aaff', edge_color='#00aaff', edge_width=0.0, size=7.0, opacity=1.0,
                 blending='opaque', visible=True
             )
 
@@ -410,9 +410,10 @@ def callback(self, viewer, data, zeros, hist_widget, hist_layout, selection_widg
                 if len(viewer.layers) == layers:
                     viewer.layers.pop(layers - 1)
 
-                viewer.add_points(
-                    centroids, name='adjusted gate', face_color='orange', edge_color='orange',
-                    edge_width=0.0, size=7.0, opacity=1.0, blending='opaque'
+                add_centroid_points(
+                    viewer, centroids, key=(sample, 'adjusted gate'), name='adjusted gate',
+                    face_color='orange', edge_color='orange', edge_width=0.0, size=7.0,
+                    opacity=1.0, blending='opaque'
                 )
 
         button.on_clicked(apply_cutoff)
@@ -25,7 +25,8 @@ from qtpy.QtCore import QTimer
 
 from ..utils import (
     input_check, read_markers, napari_notification, 
-    single_channel_pyramid, get_filepath, reorganize_dfcolumns, 
+    single_channel_pyramid, get_filepath, reorganize_dfcolumns, add_centroid_points,
+    update_provenance
 )
 
 logger = logging.getLogger(__name__)
@@ -208,8 +209,8 @@ def callback(self, viewer, sample, samples, data, initial_callback, selection_wi
             if not centroids.empty:
                 if len(viewer.layers) == 3:
                     viewer.layers.pop(2)
-                viewer.add_points(
-                    centroids, name='Intensity',
+                add_centroid_points(
+                    viewer, centroids, key=(sample, 'Intensity'), name='Intensity',
                     properties=point_properties,
                     face_color='dna_intensity',
                     face_colormap='viridis',
@@ -416,6 +417,7 @@ def intensityFilter(data, self, args):
         os.mkdir(plot_dir)
     
     idxs_to_drop = {}
+    drop_reasons = [pd.Series(dtype=np.uint8)]
     for sample in samples:
 
         group = data[data['Sample'] == sample]
@@ -500,6 +502,12 @@ def intensityFilter(data, self, args):
 
             # add IDs to idxs_to_drop dictionary
             idxs_to_drop[sample] = data_to_drop['handle']
+
+            # record cells as below (1) or above (2) cutoffs
+            drop_reasons.append(pd.Series(
+                np.where(np.log(data_to_drop[dna1]) < lowerCutoff, 1, 2),
+                index=data_to_drop.index, dtype=np.uint8
+            ))
         else:
             idxs_to_drop[sample] = pd.Series()
     
@@ -517,6 +525,8 @@ def intensityFilter(data, self, args):
     # drop unique ID column
     data.drop(columns='handle', inplace=True)
 
+    update_provenance(self.outDir, 'intensityFilter', pd.concat(drop_reasons))
+
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
     print()
@@ -1,6 +1,4 @@
-import numpy as np
-
-from ..utils import input_check, read_markers, reorganize_dfcolumns
+from ..utils import input_check, read_markers, reorganize_dfcolumns, normalize_channels
 
 
 def logTransform(data, self, args):
@@ -12,9 +10,8 @@ def logTransform(data, self, args):
         markers_filepath=markers_filepath, markers_to_exclude=self.markersToExclude, data=data
     )
 
-    abx_channels_mod = data[abx_channels].copy()
-    abx_channels_mod = np.log10(abx_channels_mod + 0.00000000001)
-    data.loc[:, abx_channels] = abx_channels_mod
+    # log10-transform antibody channels in place
+    normalize_channels(data, abx_channels, log=True)
 
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
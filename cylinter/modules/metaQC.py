@@ -1,15 +1,16 @@
 import os
 import sys
+import glob
 import pickle
 import logging
 
 import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.parquet
 
 import math
 from natsort import natsorted
-from sklearn.preprocessing import MinMaxScaler
-
 from datetime import datetime
 
 import seaborn as sns
@@ -24,8 +25,6 @@ from matplotlib.backends.backend_qt5agg import (
 
 from umap import UMAP
 from sklearn.manifold import TSNE
-import hdbscan
-from joblib import Memory
 
 from magicgui import magicgui
 
@@ -34,12 +33,128 @@ import napari
 from ..utils import (
     input_check, read_markers, matplotlib_warnings, categorical_cmap, SelectFromCollection, 
     cluster_expression, napari_notification, marker_channel_number, single_channel_pyramid,
-    get_filepath, reorganize_dfcolumns
+    get_filepath, reorganize_dfcolumns, normalize_channels, read_checkpoint_index,
+    read_checkpoint_rows, read_provenance, update_provenance, provenance_index, hdbscan_labels,
+    embedding_key, load_embedding, save_embedding, knn_graph
 )
 
 logger = logging.getLogger(__name__)
 
 
+def write_qc_data(QCData, path, batch_size):
+    """Write QCData to parquet with one row group per clustering chunk of
+    about batch_size cells (a single chunk below twice that size)."""
+    if len(QCData) < batch_size * 2:
+        num_chunks = 1
+    else:
+        num_chunks = math.ceil(len(QCData) / batch_size)
+    sizes = [len(i) for i in np.array_split(np.arange(len(QCData)), num_chunks)]
+    bounds = np.cumsum([0] + sizes)
+
+    table = pyarrow.Table.from_pandas(QCData, preserve_index=True)
+    with pyarrow.parquet.ParquetWriter(path, table.schema) as writer:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(start, stop - start), row_group_size=stop - start)
+
+
+def reclassify_labels(clusters, qc_status, clean_cutoff, noisy_cutoff):
+    """Reclassify cells as clean or noisy by the makeup of their clusters.
+
+    Cells in clusters with a clean fraction >= clean_cutoff become clean,
+    those in clusters with a noisy fraction >= noisy_cutoff become noisy,
+    and those in mixed clusters keep their QC status. Unclustered cells
+    (label -1) are considered noisy. Returns an array of 'clean'/'noisy'.
+    """
+    qc_clean = qc_status == 'clean'
+    qc_noisy = qc_status == 'noisy'
+
+    ids, codes = np.unique(clusters, return_inverse=True)
+    sizes = np.bincount(codes, minlength=len(ids))
+    clean_frac = np.bincount(codes, weights=qc_clean, minlength=len(ids)) / sizes
+    noisy_frac = np.bincount(codes, weights=qc_noisy, minlength=len(ids)) / sizes
+
+    # cluster-level decisions: 1 clean, 0 noisy, -1 per-cell QC status
+    decision = np.where(
+        clean_frac >= clean_cutoff, 1, np.where(noisy_frac >= noisy_cutoff, 0, -1)
+    )
+    decision[ids == -1] = 0
+
+    cell_decision = decision[codes]
+    is_clean = np.where(cell_decision == -1, qc_clean, cell_decision == 1)
+
+    return np.where(is_clean, 'clean', 'noisy')
+
+
+def read_qc_chunk(path, chunk_index):
+    """Read one clustering chunk of QCData from a memory-mapped parquet file."""
+    return (
+        pyarrow.parquet.ParquetFile(path, memory_map=True)
+        .read_row_group(chunk_index).to_pandas()
+    )
+
+
+def save_reclassified(reclass_dir, chunk_number, clean, noisy):
+    """Store a chunk's reclassified clean and noisy data, one file per chunk,
+    so earlier chunks are never rewritten (re-running a chunk replaces its own)."""
+    for status, df in [('clean', clean), ('noisy', noisy)]:
+        status_dir = os.path.join(reclass_dir, 'reclassified', status)
+        if not os.path.exists(status_dir):
+            os.makedirs(status_dir)
+        df.to_parquet(os.path.join(status_dir, f'{chunk_number}.parquet'), index=True)
+
+
+def reclassified_paths(reclass_dir, status):
+    return natsorted(glob.glob(os.path.join(reclass_dir, 'reclassified', status, '*.parquet')))
+
+
+def reclassified_count(reclass_dir, status):
+    """Number of cells stored as reclassified clean or noisy, from file metadata."""
+    return sum(
+        pyarrow.parquet.ParquetFile(path).metadata.num_rows
+        for path in reclassified_paths(reclass_dir, status)
+    )
+
+
+def load_reclassified(reclass_dir, status, columns):
+    """Read the given columns of all cells stored as reclassified clean or noisy."""
+    frames = []
+    for path in reclassified_paths(reclass_dir, status):
+        names = pyarrow.parquet.read_schema(path).names
+        frames.append(pd.read_parquet(path, columns=[c for c in columns if c in names]))
+    # skip chunks without cells of this status, which carry no column dtypes
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, axis=0).reindex(columns=columns)
+
+
+def migrate_qc_pickles(reclass_dir, batch_size):
+    """Convert a QCData.pkl and reclass_storage_dict.pkl written by earlier
+    versions into the parquet working set so that runs can be resumed."""
+    pickle_path = os.path.join(reclass_dir, 'QCData.pkl')
+    if not os.path.exists(pickle_path):
+        return
+
+    logger.info('Converting pickled metaQC working set to parquet')
+    with open(pickle_path, 'rb') as f:
+        write_qc_data(pickle.load(f), os.path.join(reclass_dir, 'QCData.parquet'), batch_size)
+    os.remove(pickle_path)
+
+    storage_path = os.path.join(reclass_dir, 'reclass_storage_dict.pkl')
+    if os.path.exists(storage_path):
+        with open(storage_path, 'rb') as f:
+            reclass_storage_dict = pickle.load(f)
+        # chunks are numbered from 1 (as are chunk directories), so the
+        # pickled chunks go under 0
+        save_reclassified(
+            reclass_dir, 0, reclass_storage_dict['clean'], reclass_storage_dict['noisy']
+        )
+        os.remove(storage_path)
+
+    if os.path.exists(os.path.join(reclass_dir, 'chunk.pkl')):
+        os.remove(os.path.join(reclass_dir, 'chunk.pkl'))
+
+
 def metaQC(data, self, args):
 
     print()
@@ -68,76 +183,62 @@ def metaQC(data, self, args):
     modules = ['aggregateData', 'selectROIs', 'intensityFilter',
                'areaFilter', 'cycleCorrelation', 'pruneOutliers']
 
-    # build a dictionary of data returned by each module (clean)
-    module_dict = {}
-    for module_idx, module in enumerate(modules):
-        data = pd.read_parquet(
-            os.path.join(
-                self.outDir, f'checkpoints/{module}.parquet'))
-        module_dict[module_idx] = [module, data]
+    # look up the cells remaining after each module (clean cells) in the
+    # provenance table if it is in step with the checkpoints, otherwise read
+    # only the row index of each module's checkpoint; full rows are read
+    # later for just the cells metaQC works on
+    provenance = read_provenance(self.outDir)
+    if (
+        provenance is not None
+        and len(provenance_index(provenance, modules[-1])) == len(data)
+    ):
+        module_index = {
+            module: provenance_index(provenance, module) for module in modules
+        }
+    else:
+        module_index = {
+            module: read_checkpoint_index(self.outDir, module) for module in modules
+        }
 
     #######################################################################
     # build QCData: QCData is a combination of clean and noisy data
 
     if self.metaQC:
-        # loop over modules to get data redacted by each module (noisy)
-        for module_idx in [i for i in module_dict.keys()][:-1]:
-
-            # isolate data
-            noise = module_dict[module_idx][1][
-                ~module_dict[module_idx][1].index.isin(
-                    module_dict[module_idx + 1][1].index)].copy()
-
-            # if noisy data exists, add a QC stage column
-            if not noise.empty:
-                noise.loc[:, 'Filter'] = (
-                    module_dict[module_idx + 1][0])
-
-            # append to module_dict
-            module_dict[module_idx + 1].append(noise)
-
-        # combine noisy data from all modules into a single dataframe
-        if self.delintMode:
-            # if negative ROI selection, include gated cells as noisy data
-            noisyData = pd.DataFrame()
-            for module_idx, module in enumerate(modules):
-                # the number of dictionary value enteries should be 3:
-                # module name, clean data, noisy data if noisy data exists
-                if len(module_dict[module_idx]) == 3:
-                    noisyData = pd.concat(
-                        [noisyData, module_dict[module_idx][2]], axis=0
-                    )
-        else:
-            # if postive ROI selection, exlcude cells not gated on
-            noisyData = pd.DataFrame()
-            for module_idx, module in enumerate(modules):
-                if len(module_dict[module_idx]) == 3:
-                    if not module == 'selectROIs':
-                        noisyData = pd.concat(
-                            [noisyData, module_dict[module_idx][2]],
-                            axis=0
-                        )
-
-        if noisyData.empty:
+        # cells redacted by each module (noisy) are those in the preceding
+        # module's index but not in its own; if postive ROI selection,
+        # exclude cells not gated on
+        noise_filter = []
+        for prev_module, module in zip(modules[:-1], modules[1:]):
+            if module == 'selectROIs' and not self.delintMode:
+                continue
+            prev_index = module_index[prev_module]
+            noise_filter.append(pd.Series(
+                module, index=prev_index[~prev_index.isin(module_index[module])]
+            ))
+        noise_filter = pd.concat(noise_filter)
+
+        if noise_filter.empty:
             logger.info(
                 'No data were filtered during prior QC steps. '
                 'Returning unfiltered data without reclassification.'
             )
+            update_provenance(self.outDir, 'metaQC', pd.Series(dtype=np.uint8))
             return data
 
-        # create QC_status column for combined noisy data
-        noisyData.loc[:, 'QC_status'] = 'noisy'
+        # get raw version (untransformed, not rescaled) of noisy data and
+        # of cells in the fully-redacted dataframe from the first module
+        clean_index = module_index[modules[-1]]
+        raw = read_checkpoint_rows(
+            self.outDir, modules[0], noise_filter.index.union(clean_index)
+        )
 
-        # get raw version (untransformed, not rescaled) of data
-        # from fully-redacted dataframe
-        first_module_idx = modules.index(modules[0])
-        last_module_idx = modules.index(modules[-1])
+        noisyData = raw.loc[noise_filter.index]
+        noisyData['Filter'] = noise_filter.values
 
-        cleanDataRescaled = module_dict[last_module_idx][1]
+        # create QC_status column for combined noisy data
+        noisyData['QC_status'] = 'noisy'
 
-        cleanDataRaw = module_dict[first_module_idx][1][
-            module_dict[first_module_idx][1].index.isin(
-                cleanDataRescaled.index)].copy()
+        cleanDataRaw = raw[raw.index.isin(clean_index)].copy()
 
         # create QC_status column for selected clean data
         cleanDataRaw.loc[:, 'QC_status'] = 'clean'
@@ -145,24 +246,25 @@ def metaQC(data, self, args):
         # specify channels on which to perform metaQC clustering
         abx_channels_dna = [dna1] + abx_channels
 
-        # if QCData.pkl exists, read the pickle
-        if os.path.exists(os.path.join(reclass_dir, 'QCData.pkl')):
-            f = open(os.path.join(
-                reclass_dir, 'QCData.pkl'), 'rb')
-            QCData = pickle.load(f)
+        # QCData is stored as parquet with one row group per clustering
+        # chunk, so resuming reads only the chunk at chunk_index
+        qc_path = os.path.join(reclass_dir, 'QCData.parquet')
+
+        # specify the number of cells in each clustering batch
+        # (this limits clustering times and memory pressure)
+        batch_size = 500000
+
+        # convert working sets pickled by earlier versions
+        migrate_qc_pickles(reclass_dir, batch_size)
+
+        if os.path.exists(qc_path):
 
             # read current chunk index
             with open(os.path.join(reclass_dir, 'chunk_index.txt'), 'r') as f:
                 chunk_index = f.readlines()
                 chunk_index = int(chunk_index[0])
-
-            # read current chunk data if it exists
-            if os.path.exists(os.path.join(reclass_dir, 'chunk.pkl')):
-                f = open(os.path.join(
-                    reclass_dir, 'chunk.pkl'), 'rb')
-                chunk = pickle.load(f)
         else:
-            # if QCData.pkl doesn't exist, append noisyData
+            # if QCData doesn't exist, append noisyData
             # to cleanDataRaw, row-wise
             QCData = pd.concat([cleanDataRaw, noisyData], axis=0)
 
@@ -171,29 +273,12 @@ def metaQC(data, self, args):
             QCData = QCData.sample(frac=1.0, random_state=5)
             QCData.reset_index(drop=True, inplace=True)
 
-            # log-transform QCData
-            QCData.loc[:, abx_channels_dna] += 0.00000000001
-            QCData.loc[:, abx_channels_dna] = np.log10(
-                QCData[abx_channels_dna])
-
-            # rescale channel signal intensities (0-1)
-            for marker in abx_channels_dna:
-                channel_data = QCData[marker]
-
-                scaler = (
-                    MinMaxScaler(feature_range=(0, 1), copy=True)
-                    .fit(channel_data.values.reshape(-1, 1))
-                )
-                rescaled_data = scaler.transform(
-                    channel_data.values.reshape(-1, 1)
-                )
-
-                rescaled_data = pd.DataFrame(
-                    data=rescaled_data,
-                    index=channel_data.index,
-                ).rename(columns={0: marker})
+            # log-transform QCData and rescale channel signal intensities (0-1)
+            normalize_channels(QCData, abx_channels_dna, log=True, rescale='global')
 
-                QCData.update(rescaled_data)
+            # save QCData chunks
+            write_qc_data(QCData, qc_path, batch_size)
+            del QCData
 
             # initialize chunk index counter at 0
             chunk_index = '0'
@@ -201,80 +286,63 @@ def metaQC(data, self, args):
                 f.write(chunk_index)
             chunk_index = int(chunk_index)
 
-            # save QCData.pkl
-            f = open(os.path.join(reclass_dir, 'QCData.pkl'), 'wb')
-            pickle.dump(QCData, f)
-            f.close()
+        del cleanDataRaw, noisyData
 
-        ###################################################################
-        # chunk QCData
-
-        # specify the number of cells in each clustering batch
-        # (this limits clustering times and memory pressure)
-        batch_size = 500000
-
-        # ensure minimun batch size equals the batch_size variable
-        # otherwise cluster all data at once
-        if len(QCData) < (batch_size) * 2:
-            num_chunks = 1
-            chunks = np.array_split(QCData, num_chunks)
-        else:
-            num_chunks = math.ceil(len(QCData) / batch_size)
-            chunks = np.array_split(QCData, num_chunks)
-
-        # replace the specific chunk in the chunks list
-        # associated with the current chunk_index with
-        # the chunk.pkl which has clustering labels if it exits.
-        # This allows the program to avoid re-clustering the first chunk
-        try:
-            chunks[chunk_index] = chunk
-        except UnboundLocalError:
-            pass
-
-        ###################################################################
-        # initialize reclassification storage
-
-        # if reclassified data storage dict exists, open it
-        if os.path.exists(os.path.join(reclass_dir, 'reclass_storage_dict.pkl')):
-            f = open(os.path.join(
-                reclass_dir, 'reclass_storage_dict.pkl'), 'rb')
-            reclass_storage_dict = pickle.load(f)
+        num_chunks = pyarrow.parquet.ParquetFile(qc_path).num_row_groups
 
-        # else, initialize reclassified data storage dict for
-        # reclassified clean and noisy data
-        else:
-            reclass_storage_dict = {}
-            for reclass in ['clean', 'noisy']:
-                reclass_storage_dict[reclass] = pd.DataFrame()
-            f = open(os.path.join(
-                reclass_dir, 'reclass_storage_dict.pkl'), 'wb')
-            pickle.dump(reclass_storage_dict, f)
-            f.close()
         ###################################################################
 
         # loop over QCData chunks
-        for chunk in chunks[chunk_index:]:
+        for chunk_index in range(chunk_index, num_chunks):
+
+            chunk = read_qc_chunk(qc_path, chunk_index)
 
-            logger.info(f'Clustering: {chunk_index + 1} of {len(chunks)} data chunks')
+            logger.info(f'Clustering: {chunk_index + 1} of {num_chunks} data chunks')
 
             # make directory for current chunk if it hasn't already
             chunk_dir = os.path.join(reclass_dir, str(chunk_index + 1))
             if not os.path.exists(chunk_dir):
                 os.makedirs(chunk_dir)
 
-            # if embedding for current chunk has already been computed
+            # recapitulate chunk index at the point of embedding
+            chunk = chunk[~chunk['Sample'].isin(
+                self.samplesToRemoveClusteringQC)]
+            chunk = chunk.sample(
+                frac=self.fracForEmbeddingQC, random_state=5)
+
+            print(chunk[abx_channels_dna])
+
+            # identify the chunk's embedding by its input data, sampling
+            # and algorithm parameters
+            emb_params = {
+                'embeddingAlgorithmQC': self.embeddingAlgorithmQC,
+                'dimensionEmbeddingQC': self.dimensionEmbeddingQC,
+                'samplesToRemoveClusteringQC': list(self.samplesToRemoveClusteringQC),
+                'fracForEmbeddingQC': self.fracForEmbeddingQC,
+                'samplingRandomState': 5,
+            }
+            if self.embeddingAlgorithmQC == 'TSNE':
+                emb_params.update({
+                    'perplexityQC': self.perplexityQC,
+                    'earlyExaggerationQC': self.earlyExaggerationQC,
+                    'learningRateTSNEQC': self.learningRateTSNEQC, 'metricQC': self.metricQC,
+                    'randomStateQC': self.randomStateQC
+                })
+            elif self.embeddingAlgorithmQC == 'UMAP':
+                emb_params.update({
+                    'nNeighborsQC': self.nNeighborsQC,
+                    'learningRateUMAPQC': self.learningRateUMAPQC, 'metricQC': self.metricQC,
+                    'minDistQC': self.minDistQC, 'repulsionStrengthQC': self.repulsionStrengthQC,
+                    'randomState': 3
+                })
+            emb_key = embedding_key(chunk, abx_channels_dna, emb_params)
+
+            # if this embedding of the current chunk has already been computed
             # apply emb1 and emb2 to chunk dataframe
-            if os.path.exists(os.path.join(chunk_dir, 'embedding.npy')):
-
-                # recapitulate chunk index at the point of embedding
-                chunk = chunk[~chunk['Sample'].isin(
-                    self.samplesToRemoveClusteringQC)]
-                chunk = chunk.sample(
-                    frac=self.fracForEmbeddingQC, random_state=5)
+            embedding = load_embedding(chunk_dir, emb_key)
+            if embedding is not None:
+                logger.info(f'Using cached embedding {emb_key[:12]}.')
 
-                print(chunk[abx_channels_dna])
-
-                embedding = np.load(os.path.join(chunk_dir, 'embedding.npy'))
                 chunk['emb1'] = embedding[:, 0]
                 chunk['emb2'] = embedding[:, 1]
 
@@ -282,13 +350,6 @@ def metaQC(data, self, args):
                 # compute embedding for chunk
                 startTime = datetime.now()
 
-                chunk = chunk[~chunk['Sample'].isin(
-                    self.samplesToRemoveClusteringQC)]
-                chunk = chunk.sample(
-                    frac=self.fracForEmbeddingQC, random_state=5)
-
-                print(chunk[abx_channels_dna])
-
                 if self.embeddingAlgorithmQC == 'TSNE':
                     logger.info('Computing TSNE embedding...')
                     embedding = TSNE(
@@ -302,6 +363,14 @@ def metaQC(data, self, args):
                             chunk[abx_channels_dna])
 
                 elif self.embeddingAlgorithmQC == 'UMAP':
+                    # k-NN graph shared by all layouts of the same input
+                    knn_key = embedding_key(
+                        chunk, abx_channels_dna, {'nNeighborsQC': self.nNeighborsQC, 'randomState': 3}
+                    )
+                    knn, umap_random_state = knn_graph(
+                        chunk[abx_channels_dna], chunk_dir, knn_key, self.nNeighborsQC, 3
+                    )
+
                     logger.info('Computing UMAP embedding...')
                     embedding = UMAP(
                         n_components=self.dimensionEmbeddingQC,
@@ -310,8 +379,9 @@ def metaQC(data, self, args):
                         output_metric=self.metricQC,
                         min_dist=self.minDistQC,
                         repulsion_strength=self.repulsionStrengthQC,
-                        random_state=3,
+                        random_state=umap_random_state,
                         n_epochs=1000,
+                        precomputed_knn=knn,
                         init='spectral',
                         metric='euclidean',
                         metric_kwds=None,
@@ -345,7 +415,7 @@ def metaQC(data, self, args):
 
                 logger.info(f'Embedding completed in {str(datetime.now() - startTime)}')
 
-                np.save(os.path.join(chunk_dir, 'embedding'), embedding)
+                save_embedding(chunk_dir, emb_key, embedding, emb_params)
 
                 chunk['emb1'] = embedding[:, 0]
                 chunk['emb2'] = embedding[:, 1]
@@ -355,57 +425,15 @@ def metaQC(data, self, args):
 
             def reclassify_chunk(chunk, clean_cutoff, noisy_cutoff):
 
-                clean = pd.DataFrame()
-                noisy = pd.DataFrame()
-                for name, cluster in chunk.groupby(f'cluster_{self.dimensionEmbeddingQC}d'):
-                    if name != -1:
-                        
-                        # if a cluster contains >= n% clean data,
-                        # reclassify all clustering cells as noisy
-                        if (
-                           (len(cluster[cluster[
-                            'QC_status'] == 'clean']) / len(cluster)) >=
-                           clean_cutoff):
-                            clean = pd.concat([clean, cluster], axis=0)
-                        
-                        # elif a cluster contains >= n% noisy data,
-                        # reclassify all clustering cells as clean
-                        elif (
-                             (len(cluster[cluster[
-                              'QC_status'] == 'noisy']) / len(cluster)) >=
-                                noisy_cutoff):
-                            noisy = pd.concat([noisy, cluster], axis=0)
-                        else:
-                            noisy = pd.concat(
-                                [noisy, cluster[cluster['QC_status'] == 'noisy']], axis=0
-                            )
-                            clean = pd.concat(
-                                [clean, cluster[cluster['QC_status'] == 'clean']], axis=0
-                            )
+                reclass = reclassify_labels(
+                    chunk[f'cluster_{self.dimensionEmbeddingQC}d'].to_numpy(),
+                    chunk['QC_status'].to_numpy(), clean_cutoff, noisy_cutoff
+                )
+                chunk['Reclass'] = reclass
 
-                # consider -1 cells from clean data
-                # to be "noisy"
-                clean_outliers = chunk[
-                    (chunk[f'cluster_{self.dimensionEmbeddingQC}d'] == -1)
-                    &
-                    (chunk['QC_status'] == 'clean')].copy()
-                noisy = pd.concat([noisy, clean_outliers], axis=0)
-
-                # consider -1 cells from noisy data
-                # to be "noisy"
-                noisy_outliers = chunk[
-                    (chunk[f'cluster_{self.dimensionEmbeddingQC}d'] == -1)
-                    &
-                    (chunk['QC_status'] == 'noisy')].copy()
-                noisy = pd.concat([noisy, noisy_outliers], axis=0)
-
-                chunk['Reclass'] = 'init'
-                chunk.loc[
-                    chunk.index.isin(clean.index),
-                    'Reclass'] = 'clean'
-                chunk.loc[
-                    chunk.index.isin(noisy.index),
-                    'Reclass'] = 'noisy'
+                is_clean = reclass == 'clean'
+                clean = chunk[is_clean]
+                noisy = chunk[~is_clean]
 
                 return chunk, clean, noisy
 
@@ -459,22 +487,11 @@ def metaQC(data, self, args):
                         left=0.01, right=0.99, bottom=0.0,
                         top=0.9, wspace=0.0, hspace=0.0)
 
-                    clustering = hdbscan.HDBSCAN(
-                        min_cluster_size=MCS,
-                        min_samples=None,
-                        metric='euclidean', alpha=1.0, p=None,
-                        algorithm='best', leaf_size=40,
-                        memory=Memory(location=None),
-                        approx_min_span_tree=True,
-                        gen_min_span_tree=False,
-                        core_dist_n_jobs=-1,
-                        cluster_selection_method='eom',
-                        allow_single_cluster=False,
-                        prediction_data=False,
-                        match_reference_implementation=False).fit(
-                            chunk[['emb1', 'emb2']])
-
-                    chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = clustering.labels_
+                    labels = hdbscan_labels(
+                        chunk[['emb1', 'emb2']], chunk_dir, MCS, self.minSamplesQC
+                    )
+
+                    chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = labels
 
                     # scatter point selection tool assumes a
                     # sorted index, but the index of QCdata is
@@ -483,7 +500,7 @@ def metaQC(data, self, args):
                     chunk.sort_index(inplace=True)
 
                     print()
-                    logger.info(f'min_cluster_size = {MCS} {np.unique(clustering.labels_)}')
+                    logger.info(f'min_cluster_size = {MCS} {np.unique(labels)}')
                    
                     # PLOT embedding
                     for color_by in [
@@ -1047,24 +1064,13 @@ def metaQC(data, self, args):
                     print()
                     for i in rnge:
 
-                        clustering = hdbscan.HDBSCAN(
-                            min_cluster_size=i,
-                            min_samples=None,
-                            metric='euclidean', alpha=1.0, p=None,
-                            algorithm='best', leaf_size=40,
-                            memory=Memory(location=None),
-                            approx_min_span_tree=True,
-                            gen_min_span_tree=False,
-                            core_dist_n_jobs=-1,
-                            cluster_selection_method='eom',
-                            allow_single_cluster=False,
-                            prediction_data=False,
-                            match_reference_implementation=False).fit(
-                                chunk[['emb1', 'emb2']])
-
-                        chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = clustering.labels_
-
-                        logger.info(f'min_cluster_size = {i} {np.unique(clustering.labels_)}')
+                        labels = hdbscan_labels(
+                            chunk[['emb1', 'emb2']], chunk_dir, i, self.minSamplesQC
+                        )
+
+                        chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = labels
+
+                        logger.info(f'min_cluster_size = {i} {np.unique(labels)}')
                 ##########################################################
 
                 sweep_MCS.native.setSizePolicy(
@@ -1116,24 +1122,14 @@ def metaQC(data, self, args):
                     print()
                     logger.info(f'Applying saved minimum cluster size: {final_mcs_entry}')
 
-                    clustering = hdbscan.HDBSCAN(
-                        min_cluster_size=final_mcs_entry,
-                        min_samples=None,
-                        metric='euclidean', alpha=1.0, p=None,
-                        algorithm='best', leaf_size=40,
-                        memory=Memory(location=None),
-                        approx_min_span_tree=True,
-                        gen_min_span_tree=False,
-                        core_dist_n_jobs=-1,
-                        cluster_selection_method='eom',
-                        allow_single_cluster=False,
-                        prediction_data=False,
-                        match_reference_implementation=False).fit(chunk[['emb1', 'emb2']])
-                    chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = clustering.labels_
+                    labels = hdbscan_labels(
+                        chunk[['emb1', 'emb2']], chunk_dir, final_mcs_entry, self.minSamplesQC
+                    )
+                    chunk[f'cluster_{self.dimensionEmbeddingQC}d'] = labels
 
                 ###########################################################
                 # add clean and noisy data (based on final reclass_tuple)
-                # to reclass_storage_dict
+                # to reclassified storage
 
                 print()
                 logger.info(
@@ -1148,22 +1144,13 @@ def metaQC(data, self, args):
                     noisy_cutoff=final_reclass_entry[1]
                 )
 
-                # update clean and noisy storage dataframes and save
-                reclass_storage_dict['clean'] = pd.concat(
-                    [reclass_storage_dict['clean'], clean], axis=0
-                )
-                reclass_storage_dict['noisy'] = pd.concat(
-                    [reclass_storage_dict['noisy'], noisy], axis=0
-                )
-
-                f = open(os.path.join(
-                    reclass_dir, 'reclass_storage_dict.pkl'), 'wb')
-                pickle.dump(reclass_storage_dict, f)
-                f.close()
+                # store this chunk's clean and noisy data next to those
+                # of earlier chunks
+                save_reclassified(reclass_dir, chunk_index + 1, clean, noisy)
 
                 print()
-                logger.info(f"Reclassified clean tally: {len(reclass_storage_dict['clean'])}")
-                logger.info(f"Reclassified noisy tally: {len(reclass_storage_dict['noisy'])}")
+                logger.info(f"Reclassified clean tally: {reclassified_count(reclass_dir, 'clean')}")
+                logger.info(f"Reclassified noisy tally: {reclassified_count(reclass_dir, 'noisy')}")
                 print()
 
                 ###########################################################
@@ -1211,36 +1198,23 @@ def metaQC(data, self, args):
                 with open(os.path.join(reclass_dir, 'chunk_index.txt'), 'w') as f:
                     f.write(str(chunk_index))
 
-                # remove saved chunk.pkl
-                if os.path.exists(os.path.join(reclass_dir, 'chunk.pkl')):
-                    os.remove(os.path.join(reclass_dir, 'chunk.pkl'))
-
         ###################################################################
         # perform data reclassification
 
         # create explicit global labels for raw data
-        for module_idx, module in enumerate(modules):
-            if module_dict[module_idx][0] == 'aggregateData':
-                pre_qc = module_dict[module_idx][1].copy()
-                pre_qc['handle'] = (
-                    pre_qc['CellID'].map(str) + '_' + pre_qc['Sample']
-                )
-
-        # create explicit global labels for
-        # cleaned data (before reclassifiction)
-        post_qc = module_dict[
-            [i for i in module_dict.keys()][-1]][1].copy()
-        post_qc['handle'] = (
-            post_qc['CellID'].map(str) + '_' + post_qc['Sample']
+        pre_qc = raw
+        pre_qc['handle'] = (
+            pre_qc['CellID'].map(str) + '_' + pre_qc['Sample']
         )
 
-        # get raw values of cells in post_qc data
-        cleaned_raw = pre_qc[pre_qc['handle'].isin(post_qc['handle'])]
+        # get raw values of cells in cleaned data (before reclassifiction)
+        cleaned_raw = pre_qc[pre_qc.index.isin(clean_index)]
 
         # convert clean data in predominantly noisy clusters to noisy
         # to yield final clean data
-        drop = reclass_storage_dict['noisy'][
-            reclass_storage_dict['noisy']['QC_status'] == 'clean'].copy()
+        reclass_columns = ['CellID', 'Sample', 'QC_status', 'Filter']
+        drop = load_reclassified(reclass_dir, 'noisy', reclass_columns)
+        drop = drop[drop['QC_status'] == 'clean'].copy()
         
         if not drop.empty:    
             drop['handle'] = drop['CellID'].map(str) + '_' + drop['Sample']
@@ -1251,8 +1225,8 @@ def metaQC(data, self, args):
 
         # convert noisy data in predominantly clean clusters to clean
         # to yield final replace data
-        replace = reclass_storage_dict['clean'][
-            reclass_storage_dict['clean']['QC_status'] == 'noisy'].copy()
+        replace = load_reclassified(reclass_dir, 'clean', reclass_columns)
+        replace = replace[replace['QC_status'] == 'noisy'].copy()
         
         if not replace.empty:
             replace['handle'] = replace['CellID'].map(str) + '_' + replace['Sample']
@@ -1263,31 +1237,20 @@ def metaQC(data, self, args):
 
         data = pd.concat([dropped, replaced], axis=0)
 
-        ###################################################################
-        # transform data
-
-        data.loc[:, abx_channels] += 0.00000000001
-        data.loc[:, abx_channels] = np.log10(data[abx_channels])
+        # record clean cells reclassified as noisy and vice versa
+        update_provenance(
+            self.outDir, 'metaQC',
+            pd.Series(1, index=cleaned_raw.index.difference(dropped.index), dtype=np.uint8),
+            reclassified_clean=replaced.index
+        )
 
         ###################################################################
-        # rescale antibody signal intensities (0-1)
-
-        for ab in abx_channels:
-            channel_data = data[ab]
+        # log-transform and rescale antibody signal intensities (0-1)
 
-            # rescale channel signal intensities
-            scaler = (
-                MinMaxScaler(feature_range=(0, 1), copy=True)
-                .fit(channel_data.values.reshape(-1, 1))
-            )
-            rescaled_data = scaler.transform(channel_data.values.reshape(-1, 1))
+        normalize_channels(data, abx_channels, log=True, rescale='global')
 
-            rescaled_data = pd.DataFrame(
-                data=rescaled_data, index=channel_data.index
-            ).rename(columns={0: ab})
-
-            # data to return from metQC module
-            data.update(rescaled_data)
+    else:
+        update_provenance(self.outDir, 'metaQC', pd.Series(dtype=np.uint8))
 
     #######################################################################
     # compute number of cells remaining after each QC stage.
@@ -1298,8 +1261,8 @@ def metaQC(data, self, args):
     qc_dict = {}
     for module_idx, module in enumerate(modules):
 
-        mod_name = module_dict[module_idx][0]
-        mod_data = len(module_dict[module_idx][1])
+        mod_name = module
+        mod_data = len(module_index[module])
 
         if mod_name not in ['aggregateData', 'selectROIs']:
             if self.metaQC:
@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 import pickle
+import hashlib
 
 import numpy as np
 import pandas as pd
@@ -12,10 +13,9 @@ from natsort import natsorted
 import napari
 from magicgui import magicgui
 
-from sklearn.preprocessing import MinMaxScaler
-
 import seaborn as sns
 import matplotlib.pyplot as plt
+from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.backends.qt_compat import QtWidgets
 from matplotlib.backends.backend_qt5agg import (
     FigureCanvas, NavigationToolbar2QT as NavigationToolbar
@@ -25,7 +25,8 @@ from qtpy.QtCore import QTimer
 
 from ..utils import (
     input_check, read_markers, marker_channel_number, napari_notification, single_channel_pyramid,
-    get_filepath, reorganize_dfcolumns
+    get_filepath, reorganize_dfcolumns, add_centroid_points, rescale_block, update_provenance,
+    array_hash
 )
 
 logger = logging.getLogger(__name__)
@@ -35,7 +36,6 @@ arbitrary_marker_idx = None
 marker_index = 1
 lowerCutoff = 0.0
 upperCutoff = 100.0
-dfTest = None
 
 
 def keys_before_key(dictionary, specified_key):
@@ -45,6 +45,430 @@ def keys_before_key(dictionary, specified_key):
     return subset_dict
 
 
+def prune_state(df, cutoffs, state=None):
+    """Apply percentile cutoffs per sample, channel by channel.
+
+    Channels are processed serially in the given order: percentiles of a
+    channel are computed over the cells of each sample that survived the
+    preceding channels, cells outside them are dropped, and the per-sample
+    min and max of the survivors are recorded for 0-1 rescaling (as
+    MinMaxScaler would). Cells are sorted once per channel by (sample, value),
+    so each sample's values form a contiguous sorted slice.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Single-cell data with a `Sample` column and raw channel values.
+    cutoffs : iterable of (str, float, float)
+        (channel, lower percentile, upper percentile) triples.
+    state : dict
+        State returned by a previous call on the same df to continue from.
+
+    Returns
+    -------
+    state : dict
+        `keep` mask over the rows of df and, per channel applied so far, its
+        `cutoffs` and per-sample `mins` and `maxs` (ordered as `samples`).
+    low, high : np.ndarray
+        Masks of cells dropped by these cutoffs for falling below or above them.
+    """
+    if state is None:
+        samples = np.asarray(natsorted(df['Sample'].unique()), dtype=str)
+        state = {
+            'keep': np.ones(len(df), dtype=bool), 'samples': samples, 'channels': [],
+            'cutoffs': [], 'mins': [], 'maxs': []
+        }
+    else:
+        state = {k: (v.copy() if hasattr(v, 'copy') else v) for k, v in state.items()}
+    samples = state['samples']
+    codes = pd.Index(samples).get_indexer(df['Sample'].astype(str))
+    keep = state['keep']
+    low = np.zeros(len(df), dtype=bool)
+    high = np.zeros(len(df), dtype=bool)
+
+    for channel, lower, upper in cutoffs:
+        values = df[channel].to_numpy(dtype=np.float64)
+        rows = np.flatnonzero(keep)
+        rows = rows[np.lexsort((values[rows], codes[rows]))]
+        bounds = np.searchsorted(codes[rows], np.arange(len(samples) + 1))
+
+        lower_bounds = np.full(len(samples), -np.inf)
+        upper_bounds = np.full(len(samples), np.inf)
+        for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if stop > start:
+                lower_bounds[i], upper_bounds[i] = np.percentile(
+                    values[rows[start:stop]], [lower, upper]
+                )
+
+        x = values[rows]
+        is_low = x < lower_bounds[codes[rows]]
+        is_high = x > upper_bounds[codes[rows]]
+        low[rows[is_low]] = True
+        high[rows[is_high]] = True
+        keep[rows[is_low | is_high]] = False
+
+        # sorted order puts each sample's surviving min first and max last
+        rows = rows[~(is_low | is_high)]
+        bounds = np.searchsorted(codes[rows], np.arange(len(samples) + 1))
+        present = np.diff(bounds) > 0
+        mins = np.zeros(len(samples))
+        maxs = np.zeros(len(samples))
+        mins[present] = values[rows[bounds[:-1][present]]]
+        maxs[present] = values[rows[bounds[1:][present] - 1]]
+
+        state['channels'] = state['channels'] + [channel]
+        state['cutoffs'] = state['cutoffs'] + [(lower, upper)]
+        state['mins'] = state['mins'] + [mins]
+        state['maxs'] = state['maxs'] + [maxs]
+
+    return state, low, high
+
+
+def apply_prune_state(df, state):
+    """Return the rows of df kept by a pruning state, with each pruned
+    channel rescaled 0-1 per sample."""
+    codes = pd.Index(state['samples']).get_indexer(df['Sample'].astype(str))
+    keep = state['keep']
+    codes = codes[keep]
+
+    trimmed = df.take(np.flatnonzero(keep))
+    if state['channels']:
+        channels = state['channels']
+        block = trimmed[channels].to_numpy(dtype=np.float32, copy=True)
+        rescale_block(
+            block, np.column_stack(state['mins']), np.column_stack(state['maxs']), codes
+        )
+        trimmed[channels] = block
+
+    return trimmed
+
+
+def trim_and_rescale(df, cutoffs):
+    """Apply percentile cutoffs and 0-1 rescaling per sample, channel by channel
+    (see prune_state).
+
+    Returns
+    -------
+    trimmed : pd.DataFrame
+        Surviving rows of df with rescaled channels.
+    low_idxs, high_idxs : pd.Index
+        Index labels of cells dropped for falling below or above cutoffs.
+    """
+    state, low, high = prune_state(df, cutoffs)
+    return apply_prune_state(df, state), df.index[low], df.index[high]
+
+
+def prune_input_keys(df, channels):
+    """Keys identifying the input of each checkpoint of a channel series: a
+    hash of df's index and samples and of the values of the channels pruned
+    up to and including each channel."""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df.index).to_numpy().data)
+    digest.update(pd.util.hash_pandas_object(df['Sample'], index=False).to_numpy().data)
+    keys = []
+    for channel in channels:
+        digest.update(array_hash(df[channel].to_numpy()).encode())
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+def save_prune_state(state, pruning_dir):
+    """Checkpoint a pruning state under the name of its last channel."""
+    states_dir = os.path.join(pruning_dir, 'states')
+    if not os.path.exists(states_dir):
+        os.makedirs(states_dir)
+    np.savez(
+        os.path.join(states_dir, f'{state["channels"][-1]}.npz'),
+        keep=np.packbits(state['keep']), num_rows=len(state['keep']),
+        samples=state['samples'], channels=np.asarray(state['channels'], dtype=str),
+        cutoffs=np.asarray(state['cutoffs'], dtype=float),
+        mins=np.asarray(state['mins']), maxs=np.asarray(state['maxs']),
+        input_key=state.get('input_key', '')
+    )
+
+
+def load_prune_state(pruning_dir, channel):
+    """Load the pruning state checkpointed after a channel, or None."""
+    path = os.path.join(pruning_dir, 'states', f'{channel}.npz')
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as f:
+        num_rows = int(f['num_rows'])
+        return {
+            'keep': np.unpackbits(f['keep'], count=num_rows).astype(bool),
+            'samples': f['samples'], 'channels': list(f['channels']),
+            'cutoffs': [tuple(c) for c in f['cutoffs']],
+            'mins': list(f['mins']), 'maxs': list(f['maxs']),
+            'input_key': str(f['input_key']) if 'input_key' in f.files else None
+        }
+
+
+def resume_prune_state(df, cutoffs, pruning_dir):
+    """Return the pruning state for a cutoff series, starting from the latest
+    checkpoint that matches a prefix of it (and was computed from the same
+    cells and channel values) and checkpointing each channel applied beyond
+    that."""
+    cutoffs = [(channel, float(lower), float(upper)) for channel, lower, upper in cutoffs]
+    keys = prune_input_keys(df, [c[0] for c in cutoffs])
+    state = None
+    for i in range(len(cutoffs), 0, -1):
+        stored = load_prune_state(pruning_dir, cutoffs[i - 1][0])
+        if (
+            stored is not None and stored['input_key'] == keys[i - 1]
+            and stored['channels'] == [c[0] for c in cutoffs[:i]]
+            and stored['cutoffs'] == [c[1:] for c in cutoffs[:i]]
+        ):
+            state = stored
+            break
+    else:
+        i = 0
+
+    for key, cutoff in zip(keys[i:], cutoffs[i:]):
+        state, _, _ = prune_state(df, [cutoff], state)
+        state['input_key'] = key
+        save_prune_state(state, pruning_dir)
+
+    if state is None:
+        state, _, _ = prune_state(df, [])
+    return state
+
+
+def prune_reasons(df, channels, pruning_dir):
+    """Provenance reason codes of cells removed by a checkpointed cutoff
+    series: the 1-based position of the channel whose cutoffs removed each
+    cell, indexed by the labels of removed cells.
+
+    Checkpoints must have been written for df by resume_prune_state.
+    """
+    keys = prune_input_keys(df, channels)
+    reasons = np.zeros(len(df), dtype=np.uint8)
+    keep = np.ones(len(df), dtype=bool)
+    for i, channel in enumerate(channels):
+        state = load_prune_state(pruning_dir, channel)
+        if (
+            state is None or state['input_key'] != keys[i]
+            or state['channels'] != list(channels[:i + 1])
+        ):
+            raise ValueError(
+                f'No pruning checkpoint of the current data for channel {channel}; '
+                'run resume_prune_state on the full cutoff series first.'
+            )
+        channel_keep = state['keep']
+        reasons[keep & ~channel_keep] = min(i + 1, 255)
+        keep = channel_keep
+    return pd.Series(reasons[~keep], index=df.index[~keep])
+
+
+def channel_order_stats(df, channel, bins=200, step=256):
+    """Sort a channel's values per sample once for percentile cutoff previews.
+
+    Cells are ordered by (sample, value) so that the cells kept by any pair of
+    percentile cutoffs form a contiguous slice of each sample's sorted values.
+    Area is binned per sample, and cumulative Area bin counts are stored every
+    `step` cells along the sorted order, so the binned plot of any such slice
+    can be assembled without revisiting all of its cells.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Single-cell data with `Sample` and `Area` columns.
+    channel : str
+        Channel to sort.
+    bins : int
+        Number of signal and Area bins in previews.
+    step : int
+        Number of sorted cells between stored cumulative counts.
+
+    Returns
+    -------
+    stats : dict
+        Sorted `values`, their row positions in df (`rows`), sample `bounds`
+        in the sorted order, Area bin assignments and cumulative counts.
+    """
+    samples = np.asarray(natsorted(df['Sample'].unique()), dtype=str)
+    codes = pd.Index(samples).get_indexer(df['Sample'].astype(str))
+    values = df[channel].to_numpy(dtype=np.float64)
+    rows = np.lexsort((values, codes))
+    codes = codes[rows]
+    values = values[rows]
+    area = df['Area'].to_numpy(dtype=np.float64)[rows]
+    bounds = np.searchsorted(codes, np.arange(len(samples) + 1))
+
+    # bin Area over each sample's range
+    present = np.diff(bounds) > 0
+    area_mins = np.zeros(len(samples))
+    area_maxs = np.zeros(len(samples))
+    area_mins[present] = np.minimum.reduceat(area, bounds[:-1][present])
+    area_maxs[present] = np.maximum.reduceat(area, bounds[:-1][present])
+    ranges = area_maxs - area_mins
+    ranges[ranges == 0.0] = 1.0
+    area_idx = ((area - area_mins[codes]) / ranges[codes] * bins).astype(np.intp)
+    area_idx = np.clip(area_idx, 0, bins - 1)
+
+    num_steps = -(-len(rows) // step)
+    counts = np.bincount(
+        np.arange(len(rows)) // step * bins + area_idx, minlength=num_steps * bins
+    ).reshape(num_steps, bins)
+    cumulative = np.zeros((num_steps + 1, bins), dtype=np.int32)
+    np.cumsum(counts, axis=0, out=cumulative[1:])
+
+    return {
+        'samples': samples, 'bounds': bounds, 'rows': rows, 'values': values,
+        'area_idx': area_idx, 'cumulative': cumulative, 'step': step, 'bins': bins,
+        'area_mins': area_mins, 'area_maxs': area_maxs
+    }
+
+
+def sorted_percentiles(values, bounds, q):
+    """np.percentile (linear method) of each sorted slice
+    values[bounds[i]:bounds[i + 1]], read off by index instead of partitioning."""
+    n = np.diff(bounds)
+    q = np.true_divide(q, 100)
+
+    virtual = n * q + (1 + q * -1) - 1
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(np.intp)
+    following = previous + 1
+    above = virtual >= n - 1
+    previous[above] = following[above] = n[above] - 1
+    below = virtual < 0
+    previous[below] = following[below] = 0
+
+    present = n > 0
+    a = np.full(len(n), np.nan)
+    b = np.full(len(n), np.nan)
+    a[present] = values[bounds[:-1][present] + previous[present]]
+    b[present] = values[bounds[:-1][present] + following[present]]
+
+    diff_b_a = b - a
+    return np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), a + diff_b_a * gamma)
+
+
+def percentile_windows(stats, lower, upper):
+    """Return the [start, stop) positions, in the sorted order of
+    channel_order_stats, of each sample's cells kept by percentile cutoffs."""
+    values = stats['values']
+    bounds = stats['bounds']
+    lower_bounds = sorted_percentiles(values, bounds, lower)
+    upper_bounds = sorted_percentiles(values, bounds, upper)
+
+    starts = bounds[:-1].copy()
+    stops = bounds[1:].copy()
+    for i in np.flatnonzero(stops > starts):
+        sample_values = values[bounds[i]:bounds[i + 1]]
+        starts[i] += np.searchsorted(sample_values, lower_bounds[i], side='left')
+        stops[i] = bounds[i] + np.searchsorted(sample_values, upper_bounds[i], side='right')
+
+    return starts, stops
+
+
+def window_dropped_rows(stats, starts, stops):
+    """Row positions of cells falling below and above percentile windows."""
+    rows = stats['rows']
+    bounds = stats['bounds']
+    low = np.concatenate([rows[i:j] for i, j in zip(bounds[:-1], starts)])
+    high = np.concatenate([rows[i:j] for i, j in zip(stops, bounds[1:])])
+    return low, high
+
+
+def cumulative_counts(stats, positions):
+    """Area bin counts of the sorted cells before each position, from the
+    nearest stored cumulative counts plus the cells since."""
+    step = stats['step']
+    bins = stats['bins']
+    base = positions // step
+    remainder = positions - base * step
+
+    labels = np.repeat(np.arange(len(positions)), remainder)
+    offsets = np.arange(len(labels)) - np.repeat(np.cumsum(remainder) - remainder, remainder)
+    cells = np.repeat(base * step, remainder) + offsets
+
+    extra = np.bincount(
+        labels * bins + stats['area_idx'][cells], minlength=len(positions) * bins
+    ).reshape(len(positions), bins)
+    return stats['cumulative'][base] + extra
+
+
+def window_counts(stats, starts, stops):
+    """Bin each sample's percentile window by 0-1 rescaled signal and Area.
+
+    Signal bin edges are located in the window's sorted values by binary
+    search and Area counts between them are differences of cumulative counts.
+    """
+    bins = stats['bins']
+    values = stats['values']
+
+    positions = np.repeat(starts[:, None], bins + 1, axis=1)
+    for i in np.flatnonzero(stops > starts):
+        low, high = values[starts[i]], values[stops[i] - 1]
+        span = (high - low) if high > low else 1.0
+        edges = low + span * np.arange(1, bins) / bins
+        positions[i, 1:-1] = starts[i] + np.searchsorted(
+            values[starts[i]:stops[i]], edges, side='left'
+        )
+        positions[i, -1] = stops[i]
+
+    cumulative = cumulative_counts(stats, positions.ravel())
+    return np.diff(cumulative.reshape(len(starts), bins + 1, bins), axis=1)
+
+
+def plot_window_counts(counts, stats, titles, color='k', col_wrap=5):
+    """Draw binned (signal, Area) facets, one per sample, returning the
+    figure and its images for later updates with set_window_counts."""
+    num_plots = len(titles)
+    num_rows = math.ceil(num_plots / col_wrap)
+    fig, axes = plt.subplots(
+        num_rows, col_wrap, figsize=(1.27 * col_wrap, 1.27 * num_rows), squeeze=False
+    )
+    cmap = LinearSegmentedColormap.from_list('', ['white', color])
+
+    images = []
+    for i, ax in enumerate(axes.flatten()):
+        if i >= num_plots:
+            ax.remove()
+            continue
+
+        images.append(ax.imshow(
+            np.zeros(counts.shape[1:][::-1]), origin='lower', aspect='auto', cmap=cmap,
+            interpolation='nearest',
+            extent=(0.0, 1.0, stats['area_mins'][i], stats['area_maxs'][i])
+        ))
+
+        ax.set_title(titles[i], fontweight='bold', size=np.log(650 / num_plots), pad=0.0)
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        # label outer facets as FacetGrid does
+        if i >= num_plots - col_wrap:
+            ax.set_xlabel('signal', size=np.log(750 / num_plots), labelpad=1.0)
+        if i % col_wrap == 0:
+            ax.set_ylabel('Area', size=np.log(750 / num_plots), labelpad=1.0)
+
+        for side in ['top', 'right']:
+            ax.spines[side].set_visible(False)
+        ax.spines['left'].set_linewidth(0.1)
+        ax.spines['bottom'].set_linewidth(0.1)
+
+    set_window_counts(images, counts)
+
+    # linear interpol. (between 1 and 30 rows at col_wrap = 5 plots/row)
+    # for top/bottom subplot adjustment
+    pad = 1 + (num_rows - 1) * (10 - 1) / (30 - 1)
+
+    plt.tight_layout(pad=pad)
+    plt.subplots_adjust(left=0.04, right=0.98, hspace=0.8, wspace=0.3)
+
+    return fig, images
+
+
+def set_window_counts(images, counts):
+    """Update facet images in place with new window counts."""
+    for image, sample_counts in zip(images, counts):
+        shade = np.log1p(sample_counts.T)
+        image.set_data(shade)
+        image.set_clim(0.0, max(shade.max(), 1.0))
+
+
 def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_widget,percentiles_layout, arbitrary_widget, arbitrary_layout, plot_widget, plot_layout, pruning_dir, plot_dir): 
 
     check, markers_filepath = input_check(self)
@@ -153,6 +577,15 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
         plot_layout.addWidget(NavigationToolbar(raw_canvas, plot_widget))
         plot_layout.addWidget(raw_canvas)
 
+        # sort this channel's values per sample once so that percentile cutoffs
+        # are previewed from order statistics and precomputed bin counts
+        stats = channel_order_stats(
+            dfTrim, channel, bins=self.hexbinGridSize if self.hexbins else 200
+        )
+        conditions = dfTrim.groupby(dfTrim['Sample'].astype(str))['Condition'].first()
+        titles = [f'{sample}, {conditions[sample]}' for sample in stats['samples']]
+        preview = {}
+
         ##########################################################################################
         
         @magicgui(
@@ -166,8 +599,6 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
             global arbitrary_selection_toggle
             global marker_index
 
-            global dfTest
-
             # add cutoffs to dictionary and store
             if os.path.exists(os.path.join(pruning_dir, 'cutoffs.pkl')):
                 f = open(os.path.join(pruning_dir, 'cutoffs.pkl'), 'rb')
@@ -181,6 +612,15 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
             f = open(os.path.join(pruning_dir, 'cutoffs.pkl'), 'wb')
             pickle.dump(cutoffs_dict, f)
             f.close()
+
+            # checkpoint the cutoff series through this channel, resuming
+            # from the previous channel's checkpoint
+            subset_dict = keys_before_key(cutoffs_dict, channel)
+            subset_dict[channel] = cutoffs_dict[channel]
+            state = resume_prune_state(data, [
+                (ch, lower_cutoff, upper_cutoff)
+                for ch, (lower_cutoff, upper_cutoff) in subset_dict.items()
+            ], pruning_dir)
             
             # restore default slider values
             lowerCutoff = 0.0  
@@ -201,15 +641,8 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
 
                 channel = abx_channels[marker_index]
 
-                # update dfTrim to dfTest
-                if dfTest is not None:
-                    dfTest.to_parquet(os.path.join(pruning_dir, 'dfTrim.parquet'))
-                
-                # read trimmed dataframe
-                dfTrim = pd.read_parquet(os.path.join(pruning_dir, 'dfTrim.parquet'))
-
-                # restore dfTest back to None before running next marker 
-                dfTest = None
+                # trimmed dataframe through this channel
+                dfTrim = apply_prune_state(data, state)
 
                 initial_callback = False
                 callback(
@@ -276,134 +709,36 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
             global total_low_idxs
             global total_high_idxs
             
-            global dfTest
-
             ######################################################################################
             # plot trimmed signal distributions
 
-            # create a copy of dfTrim for testing cutoffs
-            dfTest = dfTrim.copy()
-
-            # create lists of indices removed according
-            # to lower and upper cutoffs (used for data viz in Napari)
-            total_low_idxs = []
-            total_high_idxs = []
-
-            # apply current percentile cutoffs to individual samples
-            for sample in natsorted(dfTest['Sample'].unique()):
-
-                # drop cells < lower cutoff and > than upper cutoff
-                indices_to_drop = []
-
-                sample_channel_data = dfTest[dfTest['Sample'] == sample][channel]
-
-                low_drop_idxs = sample_channel_data.index[
-                    sample_channel_data < np.percentile(
-                        sample_channel_data, lower_cutoff)]
-                indices_to_drop.extend(low_drop_idxs)
+            # map cutoffs to each sample's window of sorted values, keeping
+            # indices removed by lower and upper cutoffs (used for data viz in Napari)
+            starts, stops = percentile_windows(stats, lower_cutoff, upper_cutoff)
+            low_rows, high_rows = window_dropped_rows(stats, starts, stops)
+            total_low_idxs = dfTrim.index[low_rows]
+            total_high_idxs = dfTrim.index[high_rows]
 
-                high_drop_idxs = sample_channel_data.index[
-                    sample_channel_data > np.percentile(
-                        sample_channel_data, upper_cutoff)]
-                indices_to_drop.extend(high_drop_idxs)
+            counts = window_counts(stats, starts, stops)
 
-                dfTest.drop(labels=set(indices_to_drop), axis=0, inplace=True, errors='raise')
-
-                # rescale residual signal intensities
-                trimmed_data = dfTest[dfTest['Sample'] == sample][channel]
-
-                scaler = (
-                    MinMaxScaler(feature_range=(0, 1), copy=True)
-                    .fit(trimmed_data.values.reshape(-1, 1)))
-                rescaled_data = scaler.transform(trimmed_data.values.reshape(-1, 1))
-                rescaled_data = pd.DataFrame(
-                    data=rescaled_data, index=trimmed_data.index
-                ).rename(columns={0: channel})
-
-                # update residual signal intensities
-                dfTest.update(rescaled_data)
-
-                # update lists of total indices
-                total_low_idxs.extend(low_drop_idxs)
-                total_high_idxs.extend(high_drop_idxs)
-
-            # melt trimmed and rescaled dfTest
-            dfTest_channel = dfTest[['Sample', 'Condition', 'Area'] + [channel]].copy()
-            hist_facet = (
-                dfTest_channel
-                .sample(frac=1.0)
-                .melt(id_vars=['Sample', 'Condition', 'Area'],
-                      var_name='channel', value_name='signal')
-            )
-
-            # naturally sort hist_facet by sample
-            hist_facet['Sample'] = pd.Categorical(
-                hist_facet['Sample'], ordered=True,
-                categories=natsorted(hist_facet['Sample'].unique()))
-            hist_facet.sort_values('Sample', inplace=True)
-            hist_facet['Sample'] = hist_facet['Sample'].astype('str')
-
-            # create column for facet labels
-            hist_facet['for_plot'] = hist_facet['Sample'] + ', ' + hist_facet['Condition']
+            # redraw precomputed facets in place after the first preview
+            if preview:
+                set_window_counts(preview['images'], counts)
+                preview['canvas'].draw_idle()
+                return
 
             # avoid RuntimeWarning: More than 20 figures have been opened.
             # while keeping event loop running.
             plt.close(plt.gcf())
-            
-            sns.set_style('white')
 
-            # plot trimmed facets
-            g_trimmed = sns.FacetGrid(
-                hist_facet, col='for_plot', col_wrap=col_wrap,
-                height=1.27, aspect=(1.27 / 1.27), sharex=True, sharey=False
+            sns.set_style('white')
+            preview['fig'], preview['images'] = plot_window_counts(
+                counts, stats, titles, color='dimgrey' if self.hexbins else 'k',
+                col_wrap=col_wrap
             )
 
-            # use hexbins for plotting
-            if self.hexbins:
-                g_trimmed.map(
-                    plt.hexbin, 'signal', 'Area', gridsize=self.hexbinGridSize,
-                    linewidths=0.02, color='dimgrey'
-                )
-
-            # use scatter plots for plotting
-            else:
-                g_trimmed.map(plt.scatter, 'signal', 'Area', s=0.05, linewidths=0.0, color='k')
-
-            g_trimmed.set_titles(
-                col_template="{col_name}", fontweight='bold',
-                size=np.log(650 / len(g_trimmed.axes.flatten())), pad=0.0)
-
-            for ax in g_trimmed.axes.flatten():
-                ax.tick_params(axis='both', which='major', labelsize=5.0, pad=-2)
-
-                ax.set_xticks([])
-                ax.set_yticks([])
-
-                ax.xaxis.label.set_size(np.log(750 / len(g_trimmed.axes.flatten())))
-                ax.yaxis.label.set_size(np.log(750 / len(g_trimmed.axes.flatten())))
-
-                ax.xaxis.labelpad = 1.0
-                ax.yaxis.labelpad = 1.0
-
-                if self.hexbins:
-                    ax.spines['left'].set_visible(False)
-                    ax.spines['bottom'].set_visible(False)
-                else:
-                    ax.spines['left'].set_linewidth(0.1)
-                    ax.spines['bottom'].set_linewidth(0.1)
-
-                # linear interpol. (between 1 and 30 rows at 5 plots/row)
-                # for top/bottom subplot adjustment
-                pad = (
-                    1 + (math.ceil(len(g_trimmed.axes.flatten())/col_wrap) - 1) * (10 - 1)/(30 - 1)
-                )
-
-                plt.tight_layout(pad=pad)
-                plt.subplots_adjust(left=0.04, right=0.98, hspace=0.8, wspace=0.3)
-            
             # remove old widgets from plot_layout
             count = plot_layout.count()
-            # print('widget children:', plot_widget.children())
             
             for i in range(count - 1, -1, -1):
                 item = plot_layout.itemAt(i)
@@ -412,11 +747,11 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
                     widget.setParent(None)
 
             # add updated plot widgets to plot_layout
-            trimmed_canvas = FigureCanvas(g_trimmed.fig)
+            preview['canvas'] = FigureCanvas(preview['fig'])
 
             # add navigation tool bar and figure canvas to widget
-            plot_layout.addWidget(NavigationToolbar(trimmed_canvas, plot_widget))
-            plot_layout.addWidget(trimmed_canvas)
+            plot_layout.addWidget(NavigationToolbar(preview['canvas'], plot_widget))
+            plot_layout.addWidget(preview['canvas'])
             
             # add sample_selector and next_channel button to plot_layout 
             plot_layout.addWidget(sample_selector.native)
@@ -475,13 +810,13 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
                     (dfTrim.index.isin(total_high_idxs)) &
                     (dfTrim['Sample'] == sample)]
 
-                viewer.add_points(
-                    low_centroids, name='low centroids', properties=None,
-                    face_color='magenta', edge_color='k', edge_width=0.0, size=8.0)
+                add_centroid_points(
+                    viewer, low_centroids, key=(sample, 'low centroids'), name='low centroids',
+                    properties=None, face_color='magenta', edge_color='k', edge_width=0.0, size=8.0)
 
-                viewer.add_points(
-                    high_centroids, name='high centroids', properties=None,
-                    face_color='cyan', edge_color='k', edge_width=0.0, size=8.0)
+                add_centroid_points(
+                    viewer, high_centroids, key=(sample, 'high centroids'), name='high centroids',
+                    properties=None, face_color='cyan', edge_color='k', edge_width=0.0, size=8.0)
 
                 napari_notification(f'Viewing outliers in sample {sample}')
             else:
@@ -537,64 +872,16 @@ def callback(self, viewer, channel, dfTrim, data, initial_callback, percentiles_
                         subset_dict = keys_before_key(cutoffs_dict, channel)
                         
                         if subset_dict:
-                            for ch, (lower_cutoff, upper_cutoff) in subset_dict.items():
-                                
-                                for sample in natsorted(dfTrim['Sample'].unique()):
-
-                                    sample_channel_data = dfTrim[dfTrim['Sample'] == sample][ch]
-
-                                    # drop cells < lower cutoff and > than upper cutoff
-                                    indices_to_drop = []
-
-                                    indices_to_drop.extend(
-                                        sample_channel_data.index[
-                                            sample_channel_data < np.percentile(
-                                                sample_channel_data,
-                                                cutoffs_dict[ch][0])])
-
-                                    indices_to_drop.extend(
-                                        sample_channel_data.index[
-                                            sample_channel_data > np.percentile(
-                                                sample_channel_data,
-                                                cutoffs_dict[ch][1])])
-
-                                    dfTrim.drop(
-                                        labels=set(indices_to_drop), axis=0, inplace=True,
-                                        errors='raise'
-                                    )
-
-                                    # rescale pruned antibody signal intensities
-                                    trimmed_data = dfTrim[dfTrim['Sample'] == sample][ch]
-
-                                    scaler = (
-                                        MinMaxScaler(feature_range=(0, 1), copy=True)
-                                        .fit(trimmed_data.values.reshape(-1, 1)))
-                                    rescaled_data = scaler.transform(
-                                        trimmed_data.values.reshape(-1, 1))
-                                    rescaled_data = pd.DataFrame(
-                                        data=rescaled_data, index=trimmed_data.index,
-                                    ).rename(columns={0: ch})
-
-                                    dfTrim.update(rescaled_data)
+                            dfTrim = apply_prune_state(data, resume_prune_state(data, [
+                                (ch, lower_cutoff, upper_cutoff)
+                                for ch, (lower_cutoff, upper_cutoff) in subset_dict.items()
+                            ], pruning_dir))
                         else:
                             # select the first marker to pass to the callback function
                             channel = abx_channels[0]
                             
                             # rescale first channel's signal intensities 0-1 per sample
-                            for sample in natsorted(dfTrim['Sample'].unique()):
-                                raw_channel_data = dfTrim[dfTrim['Sample'] == sample][channel]
-                                scaler = (
-                                    MinMaxScaler(feature_range=(0, 1), copy=True)
-                                    .fit(raw_channel_data.values.reshape(-1, 1)))
-                                rescaled_data = scaler.transform(
-                                    raw_channel_data.values.reshape(-1, 1)
-                                )
-                                rescaled_data = pd.DataFrame(
-                                    data=rescaled_data, index=raw_channel_data.index
-                                ).rename(columns={0: channel})
-                                dfTrim.update(rescaled_data)
-                        
-                        dfTrim.to_parquet(os.path.join(pruning_dir, 'dfTrim.parquet'))
+                            dfTrim, _, _ = trim_and_rescale(dfTrim, [(channel, 0.0, 100.0)])
                         
                         initial_callback = False
                         callback(
@@ -725,19 +1012,7 @@ def pruneOutliers(data, self, args):
         channel = abx_channels[0]
         
         # rescale first channel's signal intensities 0-1 per sample
-        for sample in natsorted(dfTrim['Sample'].unique()):
-            raw_channel_data = dfTrim[dfTrim['Sample'] == sample][channel]
-            scaler = (
-                MinMaxScaler(feature_range=(0, 1), copy=True)
-                .fit(raw_channel_data.values.reshape(-1, 1)))
-            rescaled_data = scaler.transform(raw_channel_data.values.reshape(-1, 1))
-            rescaled_data = pd.DataFrame(
-                data=rescaled_data, index=raw_channel_data.index
-            ).rename(columns={0: channel})
-            dfTrim.update(rescaled_data)
-        
-        # save dfTrim
-        dfTrim.to_parquet(os.path.join(pruning_dir, 'dfTrim.parquet'))
+        dfTrim, _, _ = trim_and_rescale(dfTrim, [(channel, 0.0, 100.0)])
 
         viewer.window.add_dock_widget(
             percentiles_widget, name='Select Percentile Cutoffs', area='right'
@@ -773,48 +1048,12 @@ def pruneOutliers(data, self, args):
         try:
             channel = abx_channels[abx_channels.index(last_channel_in_dict) + 1]
 
-            # trim and rescale all channels in cutoffs_dict
-            for ch, (lower_cutoff, upper_cutoff) in cutoffs_dict.items():
-                for sample in natsorted(dfTrim['Sample'].unique()):
-
-                    sample_channel_data = dfTrim[dfTrim['Sample'] == sample][ch]
-
-                    # drop cells < lower cutoff and > than upper cutoff
-                    indices_to_drop = []
-
-                    indices_to_drop.extend(
-                        sample_channel_data.index[
-                            sample_channel_data < np.percentile(
-                                sample_channel_data,
-                                cutoffs_dict[ch][0])])
-
-                    indices_to_drop.extend(
-                        sample_channel_data.index[
-                            sample_channel_data > np.percentile(
-                                sample_channel_data,
-                                cutoffs_dict[ch][1])])
-
-                    dfTrim.drop(
-                        labels=set(indices_to_drop), axis=0, inplace=True,
-                        errors='raise'
-                    )
-
-                    # rescale pruned antibody signal intensities
-                    trimmed_data = dfTrim[dfTrim['Sample'] == sample][ch]
-
-                    scaler = (
-                        MinMaxScaler(feature_range=(0, 1), copy=True)
-                        .fit(trimmed_data.values.reshape(-1, 1)))
-                    rescaled_data = scaler.transform(
-                        trimmed_data.values.reshape(-1, 1))
-                    rescaled_data = pd.DataFrame(
-                        data=rescaled_data, index=trimmed_data.index,
-                    ).rename(columns={0: ch})
-
-                    dfTrim.update(rescaled_data)
-
-            # save trimmed and rescaled dataframe
-            dfTrim.to_parquet(os.path.join(pruning_dir, 'dfTrim.parquet'))
+            # trim and rescale all channels in cutoffs_dict, resuming from
+            # the latest checkpoint instead of replaying every channel
+            dfTrim = apply_prune_state(data, resume_prune_state(data, [
+                (ch, lower_cutoff, upper_cutoff)
+                for ch, (lower_cutoff, upper_cutoff) in cutoffs_dict.items()
+            ], pruning_dir))
 
             viewer.window.add_dock_widget(
                 percentiles_widget, name='Select Percentile Cutoffs', area='right'
@@ -881,40 +1120,14 @@ def pruneOutliers(data, self, args):
             )
             sys.exit()
 
-        for sample in natsorted(data['Sample'].unique()):
-
-            sample_channel_data = data[data['Sample'] == sample][channel]
-
-            # drop cells < lower cutoff and > than upper cutoff
-            indices_to_drop = []
-
-            indices_to_drop.extend(
-                sample_channel_data.index[
-                    sample_channel_data < np.percentile(
-                        sample_channel_data, lowerCutoff)])
-
-            indices_to_drop.extend(
-                sample_channel_data.index[
-                    sample_channel_data > np.percentile(
-                        sample_channel_data, upperCutoff)])
-
-            data.drop(
-                labels=set(indices_to_drop), axis=0, inplace=True, errors='raise'
-            )
-
-            # rescale trimmed antibody signal intensities
-            trimmed_data = data[data['Sample'] == sample][channel]
-
-            scaler = (
-                MinMaxScaler(feature_range=(0, 1), copy=True)
-                .fit(trimmed_data.values.reshape(-1, 1)))
-            rescaled_data = scaler.transform(
-                trimmed_data.values.reshape(-1, 1))
-            rescaled_data = pd.DataFrame(
-                data=rescaled_data, index=trimmed_data.index,
-            ).rename(columns={0: channel})
-
-            data.update(rescaled_data)
+    # trim and rescale all channels, reusing checkpoints of the gating session
+    state = resume_prune_state(
+        data, [(channel, *cutoffs_dict[channel]) for channel in abx_channels], pruning_dir
+    )
+    update_provenance(
+        self.outDir, 'pruneOutliers', prune_reasons(data, abx_channels, pruning_dir)
+    )
+    data = apply_prune_state(data, state)
 
     ##############################################################################################
     # rescale remaining data between 0-1 across all samples
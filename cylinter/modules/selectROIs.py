@@ -7,8 +7,7 @@ from pathlib import Path
 from dataclasses import dataclass, field
 
 import numpy as np
-
-from PIL import Image, ImageDraw
+import pandas as pd
 
 import matplotlib.pyplot as plt
 from matplotlib.backends.qt_compat import QtWidgets
@@ -17,12 +16,14 @@ from qtpy.QtCore import QTimer
 import napari
 from magicgui import magicgui
 from magicgui.widgets import ComboBox, SpinBox, Container, Button, CheckBox
-from skimage.morphology import flood
+from joblib import Parallel, delayed
 
 from ..utils import (
     input_check, read_markers, get_filepath, marker_channel_number, napari_notification,
-    single_channel_pyramid, triangulate_ellipse, reorganize_dfcolumns, 
-    upscale, ArtifactInfo, artifact_detector_v3
+    single_channel_pyramid, shapes_contain_points, centroid_index,
+    reorganize_dfcolumns, lookup_mask, pyramid_scale, ArtifactInfo, ArtifactStore,
+    run_artifact_detector, store_detected_artifacts, file_hash, score_artifacts,
+    update_provenance
 )
 
 logger = logging.getLogger(__name__)
@@ -32,7 +33,7 @@ logger = logging.getLogger(__name__)
 class GlobalState():
     loaded_ims = {}
     abx_layers = {}
-    base_clf = None
+    model_hash = None
     last_sample = None
     artifacts = {}
     _artifact_mask: np.ndarray = field(
@@ -70,6 +71,9 @@ def selectROIs(data, self, args):
         markers_to_exclude=self.markersToExclude,
         data=data
     )
+
+    # reason codes of cells removed from samples selected for ROI selection
+    drop_reasons = [pd.Series(dtype=np.uint8)]
  
     if self.samplesForROISelection:
 
@@ -123,10 +127,11 @@ def selectROIs(data, self, args):
                 elif self.artifactDetectionMethod == 'classical':
                     # to avoid complication, we implement the most straightforward method
                     # of registering every abx channel, even if some may not have artifacts
+                    # masks and seeds of a channel share one per-sample store
                     for abx_channel in abx_channels:
                         varname_filename_lst += [
-                            (f'{abx_channel}_mask', f'{abx_channel}_artifact_mask.pkl'),
-                            (f'{abx_channel}_seeds', f'{abx_channel}_artifact_seeds.pkl')
+                            (f'{abx_channel}_mask', abx_channel),
+                            (f'{abx_channel}_seeds', abx_channel)
                         ]
                         layer_type += [
                             (f'{abx_channel}_mask', 'image'), (f'{abx_channel}_seeds', 'point')
@@ -141,7 +146,26 @@ def selectROIs(data, self, args):
             extra_layers = {}
             for varname, fname in varname_filename_lst:
                 fdir = os.path.join(art_dir, fname)
-                if os.path.exists(fdir):
+                if (
+                    self.artifactDetectionMethod == 'classical' 
+                    and layer_type[varname] in ['image', 'point']
+                ):
+                    if varname.endswith('_seeds'):
+                        extra_layers[varname] = extra_layers[f'{fname}_mask']
+                        continue
+                    extra_layers[varname] = ArtifactStore(fdir)
+                    
+                    # convert masks saved in the legacy pickle format once,
+                    # then set the pickle aside so deleted masks stay deleted
+                    legacy_path = os.path.join(art_dir, f'{fname}_artifact_mask.pkl')
+                    if os.path.exists(legacy_path):
+                        if len(extra_layers[varname]) == 0:
+                            logger.info(
+                                f'Converting {fname} artifact masks to per-sample format.'
+                            )
+                            extra_layers[varname].import_pickle(legacy_path)
+                        os.replace(legacy_path, f'{legacy_path}.converted')
+                elif os.path.exists(fdir):
                     f = open(fdir, 'rb')
                     extra_layers[varname] = pickle.load(f)
                 else:
@@ -150,42 +174,86 @@ def selectROIs(data, self, args):
         
         extra_layers, layer_type, layer_name, varname_filename_lst = load_extra_layers()
 
+        ###################################################################
+        # Precompute classical artifact masks for all sample/channel pairs
+        # that do not have one yet so the GUI only loads stored results.
+        def batch_artifact_detection():
+            params = {'downscale': self.artifactDetectionDownscale}
+            jobs = [
+                (sample, abx_channel) for sample in self.samplesForROISelection
+                for abx_channel in abx_channels
+                if sample not in extra_layers[f'{abx_channel}_mask']
+            ]
+            if not jobs:
+                return
+
+            logger.info(
+                f'Computing artifact masks for {len(jobs)} sample/channel pair(s).'
+            )
+            # workers write results to each channel's ArtifactStore (read back
+            # lazily here), so only (store root, sample) keys are returned
+            store_channels = {
+                extra_layers[f'{abx_channel}_mask'].root: abx_channel
+                for abx_channel in abx_channels
+            }
+            for store_root, sample in Parallel(
+                    n_jobs=-1, return_as='generator_unordered')(
+                    delayed(store_detected_artifacts)(
+                        extra_layers[f'{abx_channel}_mask'].root, sample,
+                        get_filepath(self, check, sample, 'TIF'),
+                        channel=marker_channel_number(markers, abx_channel),
+                        downscale=params['downscale'], n_jobs=1
+                    ) for sample, abx_channel in jobs):
+                logger.info(
+                    f'Stored artifact mask for sample {sample}, '
+                    f'channel {store_channels[store_root]}.'
+                )
+
+        if (
+            self.autoArtifactDetection and self.artifactDetectionMethod == 'classical'
+            and self.batchArtifactDetection
+        ):
+            batch_artifact_detection()
+
         def float_roi_layer_to_top():
             roi_layer_id = viewer.layers.index(viewer.layers[layer_name['ROI']])
             top_layer_id = len(viewer.layers)
             viewer.layers.move(roi_layer_id, top_layer_id)
             
         ###################################################################
-        def artifact_detection_model_MLP(data):
-            if global_state.base_clf is None:
-                model_path = os.path.join(
-                    Path(__file__).absolute().parent,
-                    '../pretrained_models/pretrained_model.pkl'
-                )
-                with open(model_path, 'rb') as f:
-                    global_state.base_clf = pickle.load(f)
-
-            # Consider put this into the sklearn pipeline?!
-            # make sure to strip off cell_id first
-            if ('CellID' in data.columns):
-                model_input = data.loc[:, data.columns != 'CellID']
-
-            # keep just relevant columns
-            marker_list = [
-                'Hoechst0', 'anti_CD3', 'anti_CD45RO', 'Keratin_570', 'aSMA_660', 'CD4_488',
-                'CD45_PE', 'PD1_647', 'CD20_488', 'CD68_555', 'CD8a_660', 'CD163_488',
-                'FOXP3_570', 'PDL1_647', 'Ecad_488', 'Vimentin_555', 'CDX2_647', 'LaminABC_488',
-                'Desmin_555', 'CD31_647', 'PCNA_488', 'CollagenIV_647', 'Area', 'MajorAxisLength',
-                'MinorAxisLength', 'Eccentricity', 'Solidity', 'Extent', 'Orientation'
-            ]
+        artifact_model_path = os.path.join(
+            Path(__file__).absolute().parent,
+            '../pretrained_models/pretrained_model.pkl'
+        )
+        prediction_dir = os.path.join(art_dir, 'predictions')
+
+        # keep just relevant columns
+        marker_list = [
+            'Hoechst0', 'anti_CD3', 'anti_CD45RO', 'Keratin_570', 'aSMA_660', 'CD4_488',
+            'CD45_PE', 'PD1_647', 'CD20_488', 'CD68_555', 'CD8a_660', 'CD163_488',
+            'FOXP3_570', 'PDL1_647', 'Ecad_488', 'Vimentin_555', 'CDX2_647', 'LaminABC_488',
+            'Desmin_555', 'CD31_647', 'PCNA_488', 'CollagenIV_647', 'Area', 'MajorAxisLength',
+            'MinorAxisLength', 'Eccentricity', 'Solidity', 'Extent', 'Orientation'
+        ]
+
+        def artifact_model_args(sample):
+            # predictions are cached per sample under the hash of the model file
+            if global_state.model_hash is None:
+                global_state.model_hash = file_hash(artifact_model_path)
+            sample_data = data[data['Sample'] == sample]
+            return (
+                artifact_model_path, global_state.model_hash, sample_data[marker_list],
+                sample_data['CellID'].to_numpy(), prediction_dir, sample
+            )
 
-            model_input = model_input[marker_list]
+        def artifact_detection_model_MLP(sample):
+            return score_artifacts(*artifact_model_args(sample))
 
-            # clf_probs = base_clf.predict_proba(data.values)
-            clf_preds = global_state.base_clf.predict(model_input)
-            clf_proba = global_state.base_clf.predict_proba(model_input)
-            #####################################################
-            return clf_preds, clf_proba
+        def score_all_samples():
+            Parallel(n_jobs=-1)(
+                delayed(score_artifacts)(*artifact_model_args(sample))
+                for sample in self.samplesForROISelection
+            )
 
         def save_shapes(sample):
             if self.artifactDetectionMethod == 'MLP':
@@ -208,7 +276,6 @@ def selectROIs(data, self, args):
                     f.close()
             elif self.artifactDetectionMethod == 'classical':
                 for varname, filename in varname_filename_lst:
-                    save_layer = False
                     if layer_type[varname] == 'shape':
                         layer = viewer.layers[layer_name[varname]]
                         updated_layer_data = []
@@ -216,38 +283,27 @@ def selectROIs(data, self, args):
                             updated_layer_data.append((shape_type, roi))
                         extra_layers[varname][sample] = updated_layer_data
                         if updated_layer_data != []:
-                            save_layer = True
-                    elif layer_type[varname] == 'image' or layer_type[varname] == 'point':
-                        abx_channel = varname.split('_')[0]  # find a better way for this
+                            f = open(os.path.join(art_dir, filename), 'wb')
+                            pickle.dump(extra_layers[varname], f)
+                            f.close()
+                    elif layer_type[varname] == 'image':
+                        # only the current sample is (re)written to the store
+                        abx_channel = filename
                         artifact_info = global_state.artifacts.get(abx_channel)
+                        if artifact_info is None:
+                            continue
 
                         try:
                             viewer.layers.index(layer_name[varname])
-                        except:
-                            if artifact_info is not None:  # Napari layers are just deleted 
-                                extra_layers[varname].pop(sample, None)
-                                if len(extra_layers[varname]) > 0:
-                                    f = open(os.path.join(art_dir, filename), 'wb')
-                                    pickle.dump(extra_layers[varname], f)
-                                    f.close()
-                                else:
-                                    try:
-                                        os.remove(os.path.join(art_dir, filename))
-                                    except:
-                                        pass  # file does not exist yet
-                                continue
-                        
-                        if artifact_info is not None:
-                            extra_layers[varname][sample] = artifact_info
-                            artifact_info.features = None
-                            artifact_info.artifact_layer = None
-                            artifact_info.seed_layer = None
-                        if len(extra_layers[varname]) > 0:
-                            save_layer = True
-                    if save_layer:
-                        f = open(os.path.join(art_dir, filename), 'wb')
-                        pickle.dump(extra_layers[varname], f)
-                        f.close()
+                        except ValueError:
+                            # Napari mask layer was deleted
+                            extra_layers[varname].pop(sample, None)
+                            continue
+
+                        artifact_info.features = None
+                        artifact_info.artifact_layer = None
+                        artifact_info.seed_layer = None
+                        extra_layers[varname][sample] = artifact_info
         
         def add_layers(sample):
             # reset some global states if using classical artifact detection
@@ -335,6 +391,8 @@ def selectROIs(data, self, args):
                                 )
                             except:  # may want to be explicit here about the expected exception.
                                 points = None
+                                global_state.artifact_mask = np.array([], dtype=int)
+                                global_state.artifact_proba = np.array([], dtype=float)
                                 artifact_mask_ = []
                                 artifact_proba_ = []
                             viewer.add_points(
@@ -353,7 +411,7 @@ def selectROIs(data, self, args):
                                 np.array(artifact_proba_)
                             points_layer.refresh()
                         elif self.artifactDetectionMethod == 'classical':
-                            abx_channel = varname.split('_')[0]
+                            abx_channel = varname.rsplit('_', 1)[0]
                             try:
                                 extra_layers[varname][sample].render_seeds(
                                     viewer, global_state.loaded_ims, layer_name, abx_channel
@@ -362,7 +420,7 @@ def selectROIs(data, self, args):
                                 pass
                 elif layer_type[varname] == 'image':
                     if self.autoArtifactDetection and self.artifactDetectionMethod == 'classical': 
-                        abx_channel = varname.split('_')[0]
+                        abx_channel = varname.rsplit('_', 1)[0]
                         try:
                             extra_layers[varname][sample].render_mask(
                                 viewer, global_state.loaded_ims, layer_name, abx_channel
@@ -452,14 +510,15 @@ def selectROIs(data, self, args):
                 viewer.layers.selection.active = viewer.layers[-1]
                 viewer.layers[-1].data = None
                 global_state.artifact_detection_threshold = proba_threshold
-                global_state.artifact_mask, class_probas = artifact_detection_model_MLP(data)
+                global_state.artifact_mask, class_probas = artifact_detection_model_MLP(sample)
                 global_state.artifact_proba = 1 - class_probas[:, 0]
                 artifact_mask, binarized_artifact_mask, artifact_proba = (
                     global_state.artifact_mask, 
                     global_state.binarized_artifact_mask,
                     global_state.artifact_proba
                 )
-                centroids = data[['Y_centroid', 'X_centroid']][binarized_artifact_mask]
+                centroids = data[['Y_centroid', 'X_centroid']][
+                    data['Sample'] == sample][binarized_artifact_mask]
                 points_layer = viewer.layers[-1]
                 points_layer.face_color_mode = 'cycle'
                 points_layer.add(centroids)
@@ -473,6 +532,11 @@ def selectROIs(data, self, args):
                 points_layer.refresh()
                 viewer.layers.selection.active = viewer.layers[-2]
 
+            @magicgui(call_button='Score All ROI Samples')
+            def score_all_MLP():
+                score_all_samples()
+                napari_notification('Artifact predictions cached for all ROI samples.')
+
             @label_artifacts_MLP.proba_threshold.changed.connect
             def on_slider_changed(threshold):
                 # consider using resource management "with...as" here
@@ -528,14 +592,18 @@ def selectROIs(data, self, args):
                         except:
                             pass
                     # next, compute
-                    params = {'downscale': 2}
+                    params = {'downscale': self.artifactDetectionDownscale}
+                    params['scale'] = pyramid_scale(
+                        loaded_ims[abx_channel], params['downscale']
+                    )
                     if sensitivity_auto_checkbox.value:
                         h = None
                     else:
                         h = 255 - sensitivity_spinbox.value
                     artifact_mask, im_transformed, seeds, tols, opt_h = \
-                        artifact_detector_v3(
-                            loaded_ims[abx_channel], downscale=params['downscale'], h=h
+                        run_artifact_detector(
+                            loaded_ims[abx_channel], downscale=params['downscale'], h=h,
+                            out=extra_layers[f'{abx_channel}_mask'].zarr_path(sample)
                         )
                     sensitivity_spinbox.value = 255 - opt_h
                     sensitivity_auto_checkbox.value = True
@@ -577,18 +645,10 @@ def selectROIs(data, self, args):
                     df = artifacts[abx_channel].seed_layer.features
                     pt_idx = df[df['id'] == pt_id]['tol'].index.to_list()[0]
                     old_tol = df.loc[pt_idx, 'tol']
-                    im_transformed = artifacts[abx_channel].transformed
-                    old_fill = flood(
-                        im_transformed, seed_point=tuple(artifacts[abx_channel].seeds[pt_id]), 
-                        tolerance=old_tol
-                    ) 
                     new_tol = tolerance_spinbox.value
-                    new_fill = flood(
-                        im_transformed, seed_point=tuple(artifacts[abx_channel].seeds[pt_id]), 
-                        tolerance=new_tol
-                    )
-                    artifacts[abx_channel].update_mask(
-                        artifacts[abx_channel].mask + new_fill - old_fill
+                    # floods are cached and only their bounding box is updated
+                    artifacts[abx_channel].change_tolerance(
+                        artifacts[abx_channel].seeds[pt_id], old_tol, new_tol
                     )
                     artifacts[abx_channel].tols[pt_idx] = new_tol
                     artifacts[abx_channel].seed_layer.features.loc[pt_idx, 'tol'] = new_tol
@@ -608,7 +668,9 @@ def selectROIs(data, self, args):
             if self.autoArtifactDetection:
                 if self.artifactDetectionMethod == 'MLP':
                     widgets.append(label_artifacts_MLP)  # better function name?
-                    widget_names.append(['Automation Module'])
+                    widget_names.append('Automation Module')
+                    widgets.append(score_all_MLP)
+                    widget_names.append('Batch Artifact Scoring')
                 elif self.artifactDetectionMethod == 'classical':
                     new_widget_lst, new_widget_names = generate_widgets_for_classical_method()
                     widgets.extend(new_widget_lst)  # need to implement this
@@ -642,76 +704,22 @@ def selectROIs(data, self, args):
         for sample in samples:
             
             # try:
+            sample_data = data[['X_centroid', 'Y_centroid', 'CellID']][
+                data['Sample'] == sample].astype(int)
+            xs = sample_data['X_centroid'].to_numpy()
+            ys = sample_data['Y_centroid'].to_numpy()
+            index = centroid_index(sample, xs, ys)
+
             if extra_layers['ROI'][sample]:
 
                 logger.info(f'Generating ROI mask(s) for sample: {sample}')
 
-                sample_data = data[['X_centroid', 'Y_centroid', 'CellID']][
-                    data['Sample'] == sample].astype(int)
-
-                sample_data['tuple'] = list(
-                    zip(sample_data['X_centroid'],
-                        sample_data['Y_centroid'])
+                # test centroids directly against ROI polygons
+                sample_data['inter1'] = shapes_contain_points(
+                    extra_layers['ROI'][sample], index
                 )
-
-                file_path = get_filepath(self, check, sample, 'TIF')
-                dna, min, max = single_channel_pyramid(
-                    file_path, channel=0)
-
-                # create pillow image to convert into boolean mask
-                def shape_layer_to_mask(layer_data):
-                    img = Image.new(
-                        'L', (dna[0].shape[1], dna[0].shape[0]))
-
-                    for shape_type, verts in layer_data:
-
-                        selection_verts = np.round(verts).astype(int)
-
-                        if shape_type == 'ellipse':
-
-                            vertices, triangles = triangulate_ellipse(
-                                selection_verts
-                            )
-
-                            # flip 2-tuple coordinates returned by
-                            # triangulate_ellipse() to draw image mask
-                            vertices = [tuple(reversed(tuple(i)))
-                                        for i in vertices]
-
-                            # update pillow image with polygon
-                            ImageDraw.Draw(img).polygon(
-                                vertices, outline=1, fill=1
-                            )
-
-                        else:
-                            vertices = list(tuple(
-                                zip(selection_verts[:, 1],
-                                    selection_verts[:, 0])
-                            ))
-
-                            # update pillow image with polygon
-                            ImageDraw.Draw(img).polygon(
-                                vertices, outline=1, fill=1)
-
-                    # convert pillow image into boolean numpy array
-                    mask = np.array(img, dtype=bool)
-                    return mask
-
-                # use numpy fancy indexing to get centroids
-                # where boolean mask is True
-                xs, ys = zip(*sample_data['tuple'])
-                ROI_mask = shape_layer_to_mask(extra_layers['ROI'][sample])
-                inter1 = ROI_mask[ys, xs]
-                sample_data['inter1'] = inter1
             else:
                 logger.info(f'No ROIs selected for sample: {sample}')
-                sample_data = data[['X_centroid', 'Y_centroid', 'CellID']][
-                    data['Sample'] == sample].astype(int)
-                sample_data['tuple'] = list(
-                    zip(sample_data['X_centroid'],
-                        sample_data['Y_centroid'])
-                )
-                xs, ys = zip(*sample_data['tuple'])
                 sample_data['inter1'] = False
 
             # may want to keep track if auto artifact detection is used separately in global state
@@ -722,7 +730,9 @@ def selectROIs(data, self, args):
                 
             if self.autoArtifactDetection:
                 if self.artifactDetectionMethod == 'MLP':
-                    autoArtifactDetectionUsed = len(global_state.artifact_proba) > 0
+                    autoArtifactDetectionUsed = any(
+                        len(v[2]) > 0 for v in extra_layers['Detected Artifacts'].values()
+                    )
                 elif self.artifactDetectionMethod == 'classical':
                     autoArtifactDetectionUsed = sum(
                         [len(d) for d in list(extra_layers.values())[1:]]
@@ -730,26 +740,30 @@ def selectROIs(data, self, args):
 
                 if autoArtifactDetectionUsed:
                     if self.artifactDetectionMethod == 'MLP':
-                        ROI2_mask = shape_layer_to_mask(extra_layers['ROI2'][sample])
-                        inter2 = ~ROI2_mask[ys, xs] & (global_state.artifact_mask != 1) & \
-                            (global_state.artifact_proba > 
-                             global_state.artifact_detection_threshold)
+                        # predictions saved for this sample (none if it was not scored)
+                        points, artifact_mask, artifact_proba = (
+                            extra_layers['Detected Artifacts'].get(sample, (None, [], []))
+                        )
+                        if len(artifact_proba) == len(xs):
+                            ROI2_mask = shapes_contain_points(
+                                extra_layers['ROI2'].get(sample, []), index
+                            )
+                            inter2 = ~ROI2_mask & (artifact_mask != 1) & \
+                                (artifact_proba > 
+                                 global_state.artifact_detection_threshold)
+                        else:
+                            inter2 = np.zeros(len(xs), dtype=bool)
                     elif self.artifactDetectionMethod == 'classical':
-                        masks = []
+                        # look up centroids in each channel's downsampled mask
+                        inter2 = np.zeros(len(xs), dtype=bool)
                         for abx_channel in abx_channels:
                             artifact_info = extra_layers[f'{abx_channel}_mask'].get(sample)
                             if artifact_info is None:
                                 continue
                             else:
-                                masks.append(
-                                    upscale(artifact_info.mask > 0,
-                                            global_state.loaded_ims[abx_channel][0])
-                                )
-                        if len(masks) == 0:
-                            inter2 = False
-                        else:
-                            ROI2_mask = np.logical_or.reduce(masks)
-                            inter2 = ROI2_mask[ys, xs]
+                                inter2 |= lookup_mask(
+                                    artifact_info.mask, xs, ys, artifact_info.scale
+                                ) > 0
 
                     sample_data['inter2'] = inter2
             else:
@@ -767,6 +781,13 @@ def selectROIs(data, self, args):
                 sample_data['CellID'][sample_data['inter1'] | drop_artifact_ids]
             )
 
+            # record cells as removed by ROI selection (1) or artifact detection (2)
+            dropped = sample_data['inter1'] | drop_artifact_ids
+            drop_reasons.append(pd.Series(
+                np.where(sample_data['inter1'][dropped], 1, 2),
+                index=sample_data.index[dropped], dtype=np.uint8
+            ))
+
             # except KeyError:
             #     logger.info(
             #         f'Aborting; ROIs have not been '
@@ -820,6 +841,8 @@ def selectROIs(data, self, args):
             'Skipping ROI selection, no samples for ROI selection specified in config.yml'
         )
 
+    update_provenance(self.outDir, 'selectROIs', pd.concat(drop_reasons))
+
     data = reorganize_dfcolumns(data, markers, self.dimensionEmbedding)
 
     print()
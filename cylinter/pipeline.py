@@ -53,12 +53,15 @@ def run_pipeline(config, start_module_name):
         samplesForROISelection=config.samplesForROISelection,
         autoArtifactDetection=config.autoArtifactDetection,
         artifactDetectionMethod=config.artifactDetectionMethod,
+        batchArtifactDetection=config.batchArtifactDetection,
+        artifactDetectionDownscale=config.artifactDetectionDownscale,
 
         numBinsIntensity=config.numBinsIntensity,
 
         numBinsArea=config.numBinsArea,
 
         numBinsCorrelation=config.numBinsCorrelation,
+        dnaLossMode=config.dnaLossMode,
 
         hexbins=config.hexbins,
         hexbinGridSize=config.hexbinGridSize,
@@ -116,6 +119,9 @@ def run_pipeline(config, start_module_name):
         repulsionStrength=config.repulsionStrength,
         randomStateUMAP=config.randomStateUMAP,
 
+        minSamplesQC=config.minSamplesQC,
+        minSamples=config.minSamples,
+
         controlGroups=config.controlGroups,
         denominatorCluster=config.denominatorCluster,
         FDRCorrection=config.FDRCorrection,
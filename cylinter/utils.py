@@ -3,13 +3,21 @@ import sys
 import re
 import glob
 import pickle
+import hashlib
+import shutil
+import tempfile
 import logging
-from dataclasses import dataclass
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
 from typing import Dict
 from uuid import uuid4
+from time import perf_counter
 
+import yaml
 import numpy as np
 import pandas as pd
+import pyarrow.parquet
 
 import math
 
@@ -19,11 +27,19 @@ from matplotlib.path import Path
 from matplotlib import colors
 
 from sklearn.preprocessing import MinMaxScaler
+from sklearn.metrics import silhouette_score
+from sklearn.utils import check_random_state
+from umap.umap_ import nearest_neighbors
+import hdbscan
+from hdbscan.hdbscan_ import _tree_to_labels
 
 import zarr
 import dask.array as da
 import tifffile
 import skimage
+from scipy import ndimage
+from scipy.signal import argrelextrema
+from joblib import Parallel, delayed
 
 ## these imports are for classical artifact detection
 import napari
@@ -363,6 +379,108 @@ def reorganize_dfcolumns(data, markers, cluster_dim):
     return data
 
 
+def minmax_bounds(block, codes=None, num_groups=None):
+    """Column-wise min and max of a 2D array, ignoring NaNs (as MinMaxScaler
+    does), either over all rows or per group of rows given by integer codes.
+
+    Returns
+    -------
+    mins, maxs : np.ndarray
+        Shape (channels,) for all rows or (groups, channels) per group.
+        Empty groups get 0.0 for both.
+    """
+    if codes is None:
+        if len(block) == 0:
+            return np.zeros(block.shape[1], block.dtype), np.zeros(block.shape[1], block.dtype)
+        return np.fmin.reduce(block, axis=0), np.fmax.reduce(block, axis=0)
+
+    if num_groups is None:
+        num_groups = codes.max() + 1 if len(codes) else 0
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(num_groups + 1))
+    present = np.diff(bounds) > 0
+    starts = bounds[:-1][present]
+
+    mins = np.zeros((num_groups, block.shape[1]), dtype=block.dtype)
+    maxs = np.zeros((num_groups, block.shape[1]), dtype=block.dtype)
+    for j in range(block.shape[1]):
+        column = block[order, j]
+        mins[present, j] = np.fmin.reduceat(column, starts)
+        maxs[present, j] = np.fmax.reduceat(column, starts)
+    return mins, maxs
+
+
+def rescale_block(block, mins, maxs, codes=None):
+    """Rescale the columns of a 2D float array 0-1 in place, either with
+    global (channels,) bounds or per-group (groups, channels) bounds indexed
+    by integer row codes. Constant columns map to 0."""
+    mins = np.asarray(mins, dtype=block.dtype)
+    ranges = np.asarray(maxs, dtype=block.dtype) - mins
+    ranges[ranges == 0.0] = 1.0
+
+    if codes is None:
+        block -= mins
+        block /= ranges
+    else:
+        # one column at a time keeps temporaries to a single column
+        for j in range(block.shape[1]):
+            column = block[:, j]
+            column -= mins[codes, j]
+            column /= ranges[codes, j]
+    return block
+
+
+def normalize_channels(df, channels, log=True, rescale=None, groups=None, offset=1e-11,
+                       dtype=np.float32):
+    """Log-transform and/or rescale channel columns of a DataFrame in place.
+
+    Channels are copied once into a single `dtype` block, transformed there
+    without intermediate frames, and written back.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Single-cell data.
+    channels : list of str
+        Columns to transform.
+    log : bool
+        Whether to take log10(x + offset).
+    rescale : None, 'global', or 'sample'
+        Whether to rescale channels 0-1 over all cells, per value of the
+        `groups` column, or not at all.
+    groups : str
+        Column defining groups when rescale is 'sample' (default: 'Sample').
+
+    Returns
+    -------
+    df : pd.DataFrame
+        The same DataFrame, for chaining.
+    """
+    assert rescale in [None, 'global', 'sample'], \
+        'Invalid input for rescale.'
+
+    if not channels:
+        return df
+
+    block = df[channels].to_numpy(dtype=dtype, copy=True)
+
+    if log:
+        block += offset
+        np.log10(block, out=block)
+
+    if rescale == 'global':
+        mins, maxs = minmax_bounds(block)
+        rescale_block(block, mins, maxs)
+    elif rescale == 'sample':
+        codes, uniques = pd.factorize(df['Sample' if groups is None else groups])
+        mins, maxs = minmax_bounds(block, codes, len(uniques))
+        rescale_block(block, mins, maxs, codes)
+
+    df[channels] = block
+
+    return df
+
+
 def single_channel_pyramid(tiff_path, channel):
 
     tiff = tifffile.TiffFile(tiff_path)
@@ -438,6 +556,235 @@ def napari_warnings():
     np.seterr(divide='ignore')
 
 
+class CentroidIndex(object):
+    """Uniform-grid spatial index over 2D points (e.g., cell centroids).
+
+    Points are bucketed into square grid cells once at construction time so
+    that bounding-box, polygon, and ellipse queries only test points in the
+    grid cells overlapped by the query region rather than every point.
+
+    Parameters
+    ----------
+    xs, ys : array_like
+        Point coordinates.
+
+    points_per_bin : int
+        Target average number of points per grid cell.
+    """
+
+    def __init__(self, xs, ys, points_per_bin=16):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        self.Npts = len(self.xs)
+        self.fingerprint = (self.Npts, float(self.xs.sum()), float(self.ys.sum()))
+
+        if self.Npts == 0:
+            self.xmin = self.ymin = 0.0
+            self.bin_size = 1.0
+            self.nx = self.ny = 1
+            self.order = np.array([], dtype=np.int64)
+            self.offsets = np.zeros(2, dtype=np.int64)
+            return
+
+        self.xmin, xmax = self.xs.min(), self.xs.max()
+        self.ymin, ymax = self.ys.min(), self.ys.max()
+        area = max((xmax - self.xmin) * (ymax - self.ymin), 1.0)
+        self.bin_size = max(np.sqrt(area * points_per_bin / self.Npts), 1e-9)
+        self.nx = int((xmax - self.xmin) // self.bin_size) + 1
+        self.ny = int((ymax - self.ymin) // self.bin_size) + 1
+
+        bins = self._ix(self.xs) + self._iy(self.ys) * self.nx
+        self.order = np.argsort(bins, kind='stable')
+        self.offsets = np.searchsorted(
+            bins[self.order], np.arange(self.nx * self.ny + 1)
+        )
+
+    def __len__(self):
+        return self.Npts
+
+    def _ix(self, x):
+        return np.clip(
+            ((np.asarray(x) - self.xmin) // self.bin_size).astype(np.int64), 0, self.nx - 1
+        )
+
+    def _iy(self, y):
+        return np.clip(
+            ((np.asarray(y) - self.ymin) // self.bin_size).astype(np.int64), 0, self.ny - 1
+        )
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        """Return indices of points in grid cells overlapping a bounding box."""
+        if self.Npts == 0 or xmax < self.xmin or ymax < self.ymin:
+            return np.array([], dtype=np.int64)
+        ix0, ix1 = self._ix(xmin), self._ix(xmax)
+        iy0, iy1 = self._iy(ymin), self._iy(ymax)
+
+        # grid cells along a row are contiguous in sorted order
+        rows = np.arange(iy0, iy1 + 1) * self.nx
+        starts = self.offsets[rows + ix0]
+        stops = self.offsets[rows + ix1 + 1]
+        if len(rows) == 0 or (stops - starts).sum() == 0:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(
+            [self.order[start:stop] for start, stop in zip(starts, stops)]
+        )
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """Return sorted indices of points within a bounding box (inclusive)."""
+        cand = self._candidates(xmin, ymin, xmax, ymax)
+        x, y = self.xs[cand], self.ys[cand]
+        keep = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        return np.sort(cand[keep])
+
+    def query_polygon(self, vertices):
+        """Return sorted indices of points within an (N, 2) polygon of (x, y) vertices."""
+        vertices = np.asarray(vertices, dtype=np.float64)
+        (xmin, ymin), (xmax, ymax) = vertices.min(axis=0), vertices.max(axis=0)
+        cand = self.query_bbox(xmin, ymin, xmax, ymax)
+        if len(cand) == 0:
+            return cand
+        path = Path(vertices)
+        return cand[path.contains_points(np.column_stack([self.xs[cand], self.ys[cand]]))]
+
+    def query_ellipse(self, corners):
+        """Return sorted indices of points within an ellipse given its four (x, y)
+        bounding corners (as stored by Napari shapes layers)."""
+        vertices, triangles = triangulate_ellipse(np.asarray(corners, dtype=np.float64))
+        # drop the center vertex returned by triangulate_ellipse()
+        return self.query_polygon(vertices[1:])
+
+
+# least recently used first; bounded so a session doesn't keep every sample's index
+_centroid_indexes = OrderedDict()
+_MAX_CENTROID_INDEXES = 4
+
+
+def centroid_index(key, xs, ys):
+    """Return a cached CentroidIndex for the points (xs, ys) stored under key
+    (e.g., a sample name), rebuilding it only if the points have changed.
+    Only the _MAX_CENTROID_INDEXES most recently used indexes are kept."""
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    fingerprint = (len(xs), float(xs.sum()), float(ys.sum()))
+
+    index = _centroid_indexes.get(key)
+    if index is None or index.fingerprint != fingerprint:
+        index = CentroidIndex(xs, ys)
+        _centroid_indexes[key] = index
+    _centroid_indexes.move_to_end(key)
+    while len(_centroid_indexes) > _MAX_CENTROID_INDEXES:
+        _centroid_indexes.popitem(last=False)
+
+    return index
+
+
+def stratified_subsample(index, max_points):
+    """Return sorted indices of max_points points spread evenly over the grid
+    cells of a CentroidIndex."""
+    if len(index) <= max_points:
+        return np.arange(len(index))
+    frac = max_points / len(index)
+    # systematic sample along the index's cell-by-cell point order, so each
+    # grid cell keeps its share of points
+    ranks = np.arange(len(index))
+    keep = np.floor((ranks + 1) * frac) > np.floor(ranks * frac)
+    return np.sort(index.order[keep])
+
+
+def _camera(viewer):
+    # viewer.camera was moved to viewer.scene.camera in napari 0.9
+    return viewer.scene.camera if hasattr(viewer, 'scene') else viewer.camera
+
+
+def _visible_extent(viewer):
+    """Return the (xmin, ymin, xmax, ymax) data-coordinate extent of a 2D viewer canvas."""
+    canvas = getattr(viewer, 'canvas', None)
+    canvas_size = getattr(canvas, 'size', None) or getattr(viewer, '_canvas_size', None)
+    height, width = canvas_size if canvas_size else (1024, 1024)
+    camera = _camera(viewer)
+    cy, cx = camera.center[-2:]
+    half_w, half_h = width / camera.zoom / 2, height / camera.zoom / 2
+    return cx - half_w, cy - half_h, cx + half_w, cy + half_h
+
+
+def add_centroid_points(viewer, centroids, key=None, properties=None, max_points=200000,
+                        **kwargs):
+    """Add cell centroids to a Napari viewer as a level-of-detail points layer.
+
+    Up to max_points centroids are added as-is. Beyond that, a spatially
+    stratified subsample is shown while zoomed out, and the exact centroids of
+    the visible area (plus a margin) are swapped in whenever they number fewer
+    than max_points, using a cached CentroidIndex to find them.
+
+    Parameters
+    ----------
+    viewer : napari.Viewer
+    centroids : pd.DataFrame or np.ndarray
+        (N, 2) array of (row, col) i.e. (Y_centroid, X_centroid) coordinates.
+    key : hashable
+        Cache key for the centroid index (e.g., the sample name).
+    properties : dict
+        Per-point property arrays of length N.
+    max_points : int
+        Maximum number of points held by the layer at any time.
+    kwargs
+        Passed to viewer.add_points.
+
+    Returns
+    -------
+    layer : napari.layers.Points
+    """
+    coords = np.asarray(centroids, dtype=float)
+    if len(coords) <= max_points:
+        return viewer.add_points(coords, properties=properties, **kwargs)
+
+    if key is None:
+        key = (kwargs.get('name'), len(coords))
+    index = centroid_index(key, coords[:, 1], coords[:, 0])
+    overview = stratified_subsample(index, max_points)
+
+    def subset(idxs):
+        if properties is None:
+            return None
+        return {name: np.asarray(values)[idxs] for name, values in properties.items()}
+
+    layer = viewer.add_points(coords[overview], properties=subset(overview), **kwargs)
+    state = {'idxs': overview, 'bbox': None}
+
+    def on_camera_change(event=None):
+        if layer not in viewer.layers:
+            _camera(viewer).events.center.disconnect(on_camera_change)
+            _camera(viewer).events.zoom.disconnect(on_camera_change)
+            return
+        xmin, ymin, xmax, ymax = _visible_extent(viewer)
+        bbox = state['bbox']
+        if (
+            bbox is not None and xmin >= bbox[0] and ymin >= bbox[1]
+            and xmax <= bbox[2] and ymax <= bbox[3]
+        ):
+            return  # still within the exact points already loaded
+
+        # load the visible area with a margin of half a view on each side
+        margin_x, margin_y = (xmax - xmin) / 2, (ymax - ymin) / 2
+        padded = (xmin - margin_x, ymin - margin_y, xmax + margin_x, ymax + margin_y)
+        idxs = index.query_bbox(*padded)
+        if len(idxs) > max_points:
+            idxs, padded = overview, None
+        state['bbox'] = padded
+        if np.array_equal(idxs, state['idxs']):
+            return
+
+        state['idxs'] = idxs
+        layer.data = coords[idxs]
+        if properties is not None:
+            layer.properties = subset(idxs)
+            layer.refresh_colors()
+
+    _camera(viewer).events.center.connect(on_camera_change)
+    _camera(viewer).events.zoom.connect(on_camera_change)
+    return layer
+
+
 # scatter point selection tool
 class SelectFromCollection(object):
     """Select indices from a matplotlib collection using `LassoSelector`.
@@ -478,12 +825,13 @@ class SelectFromCollection(object):
         elif len(self.fc) == 1:
             self.fc = np.tile(self.fc, (self.Npts, 1))
 
+        self.index = CentroidIndex(self.xys[:, 0], self.xys[:, 1])
+
         self.lasso = LassoSelector(ax, onselect=self.onselect)
         self.ind = []
 
     def onselect(self, verts):
-        path = Path(verts)
-        self.ind = np.nonzero(path.contains_points(self.xys))[0]
+        self.ind = self.index.query_polygon(verts)
         self.fc[:, -1] = self.alpha_other
         self.fc[self.ind, -1] = 1
         self.collection.set_facecolors(self.fc)
@@ -523,6 +871,136 @@ def save_dataframe(df, outDir, moduleName):
     )
 
 
+def read_checkpoint_index(outDir, moduleName):
+    """Read only the row index of a module's checkpoint."""
+    return pd.read_parquet(
+        os.path.join(outDir, 'checkpoints', f'{moduleName}.parquet'), columns=[]
+    ).index
+
+
+def read_checkpoint_rows(outDir, moduleName, index):
+    """Read the rows of a module's checkpoint whose index labels are in
+    `index`, one row group at a time, in checkpoint order."""
+    path = os.path.join(outDir, 'checkpoints', f'{moduleName}.parquet')
+    checkpoint_index = read_checkpoint_index(outDir, moduleName)
+    mask = checkpoint_index.isin(index)
+
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    pieces = []
+    start = 0
+    for i in range(parquet_file.num_row_groups):
+        stop = start + parquet_file.metadata.row_group(i).num_rows
+        rows = np.flatnonzero(mask[start:stop])
+        if len(rows):
+            piece = parquet_file.read_row_group(i).take(rows).to_pandas()
+            # row groups do not carry index metadata of their own
+            piece.index = checkpoint_index[start + rows]
+            pieces.append(piece)
+        start = stop
+
+    if not pieces:
+        return parquet_file.schema_arrow.empty_table().to_pandas().iloc[:0]
+    return pd.concat(pieces, axis=0)
+
+
+# Per-cell filter provenance: a side table keyed by the aggregateData index
+# holding the id of the QC stage that removed each cell (0, aggregateData,
+# if none) and a stage-specific reason code:
+#   selectROIs: 1 ROI selection, 2 automated artifact detection
+#   intensityFilter, areaFilter: 1 below lower cutoff, 2 above upper cutoff
+#   cycleCorrelation: position (1-based) of the DNA cycle at which loss was detected
+#   pruneOutliers: position (1-based) of the channel whose cutoffs removed the cell
+#   metaQC: 1 reclassified as noisy
+# Noisy cells reclassified as clean by metaQC keep their stage and reason
+# with the RECLASSIFIED_CLEAN bit set.
+PROVENANCE_STAGES = [
+    'aggregateData', 'selectROIs', 'intensityFilter', 'areaFilter', 'cycleCorrelation',
+    'pruneOutliers', 'metaQC'
+]
+RECLASSIFIED_CLEAN = 0x80
+
+
+def provenance_path(outDir):
+    return os.path.join(outDir, 'checkpoints', 'provenance.parquet')
+
+
+def init_provenance(outDir, index):
+    """Start a provenance table in which all cells of `index` are clean."""
+    table = pd.DataFrame({
+        'stage': np.zeros(len(index), dtype=np.uint8),
+        'reason': np.zeros(len(index), dtype=np.uint8)
+    }, index=index)
+    os.makedirs(os.path.dirname(provenance_path(outDir)), exist_ok=True)
+    table.to_parquet(provenance_path(outDir), index=True)
+
+
+def read_provenance(outDir):
+    """Read the provenance table, or None if it has not been recorded."""
+    if not os.path.exists(provenance_path(outDir)):
+        return None
+    return pd.read_parquet(provenance_path(outDir))
+
+
+def update_provenance(outDir, moduleName, reasons, reclassified_clean=None):
+    """Record the cells removed by a QC stage.
+
+    Entries of this and later stages are cleared first, so that re-running a
+    module replaces what it recorded before.
+
+    Parameters
+    ----------
+    moduleName : str
+        Name of the QC stage (see PROVENANCE_STAGES).
+    reasons : pd.Series
+        Reason codes indexed by the aggregateData labels of removed cells.
+    reclassified_clean : pd.Index
+        (metaQC only) labels of noisy cells reclassified as clean.
+    """
+    table = read_provenance(outDir)
+    if table is None:
+        logger.info(
+            'Cell provenance table not found; re-run aggregateData to record it.'
+        )
+        return
+
+    stage_id = PROVENANCE_STAGES.index(moduleName)
+    stage = table['stage'].to_numpy().copy()
+    reason = table['reason'].to_numpy().copy()
+
+    cleared = stage >= stage_id
+    stage[cleared] = 0
+    reason[cleared] = 0
+    reason &= ~np.uint8(RECLASSIFIED_CLEAN)
+
+    # labels missing from the table (-1) mean it is stale; leave it untouched
+    rows = table.index.get_indexer(reasons.index)
+    reclassified_rows = (
+        np.empty(0, dtype=np.intp) if reclassified_clean is None
+        else table.index.get_indexer(reclassified_clean)
+    )
+    if (rows < 0).any() or (reclassified_rows < 0).any():
+        logger.error(
+            f'{(rows < 0).sum() + (reclassified_rows < 0).sum()} cell(s) recorded by '
+            f'{moduleName} are missing from the cell provenance table; not updating it. '
+            'Re-run the pipeline from aggregateData to rebuild it.'
+        )
+        return
+
+    stage[rows] = stage_id
+    reason[rows] = np.asarray(reasons, dtype=np.uint8)
+    reason[reclassified_rows] |= np.uint8(RECLASSIFIED_CLEAN)
+
+    table['stage'] = stage
+    table['reason'] = reason
+    table.to_parquet(provenance_path(outDir), index=True)
+
+
+def provenance_index(table, moduleName):
+    """Labels of cells remaining after a QC stage, ignoring metaQC."""
+    stage = table['stage'].to_numpy()
+    return table.index[(stage == 0) | (stage > PROVENANCE_STAGES.index(moduleName))]
+
+
 def categorical_cmap(numUniqueSamples, numCatagories, cmap='tab10', continuous=False):
 
     numSubcatagories = math.ceil(numUniqueSamples / numCatagories)
@@ -827,6 +1305,177 @@ def triangulate_ellipse(corners, num_segments=100):
     return vertices, triangles
 
 
+def shapes_contain_points(layer_data, index):
+    """Flag the indexed points that fall within any shape of a Napari shapes layer.
+
+    Shapes are tested directly against point coordinates by vectorized polygon
+    containment instead of being rasterized into a full-resolution image mask,
+    so memory scales with the number of points rather than the number of pixels.
+
+    Parameters
+    ----------
+    layer_data : list of (str, np.ndarray) tuples
+        (shape_type, vertices) pairs as stored from a Napari shapes layer;
+        vertices are in (row, col) image coordinates.
+    index : CentroidIndex
+        Spatial index over the points to test (e.g., a sample's cell centroids).
+
+    Returns
+    -------
+    inside : np.ndarray
+        Boolean array of length len(index).
+    """
+    inside = np.zeros(len(index), dtype=bool)
+
+    for shape_type, verts in layer_data:
+
+        selection_verts = np.round(verts).astype(int)
+
+        # flip (row, col) vertices to (x, y)
+        if shape_type == 'ellipse':
+            inside[index.query_ellipse(selection_verts[:, ::-1])] = True
+        else:
+            inside[index.query_polygon(selection_verts[:, ::-1])] = True
+
+    return inside
+
+
+def _flood_components(im, level):
+    """Label the 8-connected components of the upper level set im >= level."""
+    return ndimage.label(im >= level, structure=np.ones((3, 3), dtype=bool))
+
+
+def flood_fill_areas(im, seeds, tolerances):
+    """Return the number of pixels flooded from each seed at each tolerance,
+    as skimage.morphology.flood() would fill them.
+
+    The region filled from a seed of value v at tolerance t is the connected
+    component of the upper level set {im >= v - t} containing the seed,
+    provided that component has no pixel brighter than v + t (the usual case
+    for seeds on local maxima). Every gray level needed by any
+    (seed, tolerance) pair is labeled exactly once, so the cost of these
+    pairs is bounded by the number of gray levels in `im` rather than by
+    seeds x tolerances full-image floods; the remaining pairs fall back to
+    flood(), as in flood_fill_mask.
+
+    Parameters
+    ----------
+    im : np.ndarray
+        2D integer image (e.g., uint8 output of the artifact transform).
+    seeds : np.ndarray
+        (N, 2) array of (row, col) seed coordinates.
+    tolerances : np.ndarray
+        1D array of non-negative integer tolerances.
+
+    Returns
+    -------
+    areas : np.ndarray
+        (N, len(tolerances)) array of fill areas.
+    """
+    seeds = np.asarray(seeds, dtype=int).reshape(-1, 2)
+    tolerances = np.asarray(tolerances, dtype=int)
+    areas = np.zeros((len(seeds), len(tolerances)), dtype=np.int64)
+    if len(seeds) == 0:
+        return areas
+
+    seed_vals = im[seeds[:, 0], seeds[:, 1]].astype(int)
+
+    # all levels at or below the image minimum share the same components
+    levels = np.maximum(seed_vals[:, None] - tolerances[None, :], int(im.min()))
+
+    for level in np.unique(levels):
+        labeled, _ = _flood_components(im, level)
+        counts = np.bincount(labeled.ravel())
+        rows, cols = np.nonzero(levels == level)
+        seed_labels = labeled[seeds[rows, 0], seeds[rows, 1]]
+        areas[rows, cols] = counts[seed_labels]
+
+        # components reaching above v + t are not equivalent to a flood
+        comp_max = np.asarray(ndimage.maximum(im, labeled, index=seed_labels))
+        impure = comp_max > seed_vals[rows] + tolerances[cols]
+        for i, j in zip(rows[impure], cols[impure]):
+            areas[i, j] = np.count_nonzero(
+                flood(im, seed_point=tuple(seeds[i]), tolerance=int(tolerances[j]))
+            )
+
+    return areas
+
+
+def flood_fill_mask(im, seeds, tolerances):
+    """Return the sum of skimage.morphology.flood() masks from each seed at its
+    own tolerance.
+
+    Seeds whose upper level set component contains no pixel brighter than
+    v + t (the usual case for seeds on local maxima) are filled from a single
+    labeling per gray level shared by all seeds; the rest fall back to flood().
+    """
+    seeds = np.asarray(seeds, dtype=int).reshape(-1, 2)
+    tolerances = np.asarray(tolerances, dtype=int)
+    mask = np.zeros(im.shape, dtype=np.int16)
+    if len(seeds) == 0:
+        return mask
+
+    seed_vals = im[seeds[:, 0], seeds[:, 1]].astype(int)
+    levels = np.maximum(seed_vals - tolerances, int(im.min()))
+
+    for level in np.unique(levels):
+        labeled, num_labels = _flood_components(im, level)
+        at_level = np.flatnonzero(levels == level)
+        seed_labels = labeled[seeds[at_level, 0], seeds[at_level, 1]]
+
+        # components reaching above v + t are not equivalent to a flood
+        comp_max = np.asarray(ndimage.maximum(im, labeled, index=seed_labels))
+        pure = comp_max <= seed_vals[at_level] + tolerances[at_level]
+
+        multiplicity = np.bincount(
+            seed_labels[pure], minlength=num_labels + 1).astype(np.int16)
+        multiplicity[0] = 0
+        mask += multiplicity[labeled]
+
+        for i in at_level[~pure]:
+            mask += flood(im, seed_point=tuple(seeds[i]), tolerance=int(tolerances[i]))
+
+    return mask
+
+
+def _artifact_seeds(im_transformed, h, kernel_large):
+    """Return one (row, col) seed per h-maximum of im_transformed and the labeled maxima."""
+    local_maxima_ = h_maxima(im_transformed, h=h, footprint=kernel_large) if h > 0 else\
+                    local_maxima(im_transformed)
+    local_maxima_labeled = label(local_maxima_)
+    
+    # seed each local maximum at its first pixel in raster order
+    seg_ids, first_pixels = np.unique(local_maxima_labeled.ravel(), return_index=True)
+    first_pixels = first_pixels[seg_ids > 0]
+    seeds = np.column_stack(np.unravel_index(first_pixels, im_transformed.shape)).astype(int)
+    return seeds, local_maxima_labeled
+
+
+def _optimal_tolerances(im_transformed, seeds):
+    """Pick a flood tolerance per seed from its fill area vs. tolerance curve."""
+    max_contrast = np.max(im_transformed) - np.min(im_transformed)
+    num_local_maxima = len(seeds)
+    optimal_tols = np.empty((num_local_maxima,), dtype=int)
+
+    # fill area vs. tolerance curves for all seeds at once
+    num_filled_pixels = flood_fill_areas(
+        im_transformed, seeds, np.arange(int(max_contrast) + 5)
+    )
+    
+    for seg_id in range(1, num_local_maxima+1):
+        delta_num = np.diff(num_filled_pixels[seg_id-1])
+        try: 
+            optimal_tol = argrelextrema(delta_num, np.greater)[0][-2] 
+            if optimal_tol >= 20:
+                optimal_tol -= 2 #kind of a fudging factor here
+        except:
+            optimal_tol = max(0, np.argmax(delta_num > np.mean(delta_num))-1) #-1 is a conservative fudging factor here
+        
+        optimal_tols[seg_id-1] = optimal_tol
+
+    return optimal_tols
+
+
 def artifact_detector_v3(pyramid, 
                       downscale=2, 
                       erosion_kernel_size=5,
@@ -864,32 +1513,9 @@ def artifact_detector_v3(pyramid,
         except RuntimeError:
             h=255
 
-    local_maxima_ = h_maxima(im_transformed, h=h, footprint=kernel_large) if h > 0 else\
-                    local_maxima(im_transformed)
-    local_maxima_labeled = label(local_maxima_)
-    artifact_mask = np.zeros_like(im, dtype=np.int16)
-    max_contrast = np.max(im_transformed) - np.min(im_transformed)
-    
-    num_local_maxima = np.max(local_maxima_labeled)
-    seeds = np.empty((num_local_maxima, 2), dtype=int)
-    optimal_tols = np.empty((num_local_maxima,), dtype=int)
-    
-    for seg_id in range(1, num_local_maxima+1):
-        seed = np.argwhere(local_maxima_labeled==seg_id)[0]
-        num_filled_pixels = [np.sum(flood(im_transformed, seed_point=tuple(seed), 
-                                                tolerance=tol)) for tol in range(max_contrast+5)]
-        delta_num = np.diff(num_filled_pixels)
-        try: 
-            optimal_tol = argrelextrema(delta_num, np.greater)[0][-2] 
-            if optimal_tol >= 20:
-                optimal_tol -= 2 #kind of a fudging factor here
-        except:
-            optimal_tol = max(0, np.argmax(delta_num > np.mean(delta_num))-1) #-1 is a conservative fudging factor here
-        
-        seeds[seg_id-1, :] = seed
-        optimal_tols[seg_id-1] = optimal_tol
-        artifact_mask += flood(im_transformed, seed_point=tuple(seed), 
-                                                tolerance=optimal_tol)        
+    seeds, local_maxima_labeled = _artifact_seeds(im_transformed, h, kernel_large)
+    optimal_tols = _optimal_tolerances(im_transformed, seeds)
+    artifact_mask = flood_fill_mask(im_transformed, seeds, optimal_tols)
 
     if debug:
         axes[0].imshow(im, cmap='gray')
@@ -901,6 +1527,193 @@ def artifact_detector_v3(pyramid,
     return artifact_mask, im_transformed, seeds, optimal_tols, h
 
 
+def _histogram_quantile(counts, q):
+    """np.quantile (linear interpolation) of integer data given its value counts."""
+    cumulative = np.cumsum(counts)
+    position = q * (cumulative[-1] - 1)
+    lower = np.searchsorted(cumulative, np.floor(position), side='right')
+    upper = np.searchsorted(cumulative, np.ceil(position), side='right')
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+def _tile_windows(shape, tile_size, halo):
+    """Yield (core, window) slice pairs tiling a 2D shape, windows padded by halo."""
+    for row in range(0, shape[0], tile_size):
+        for col in range(0, shape[1], tile_size):
+            core = (
+                slice(row, min(row + tile_size, shape[0])),
+                slice(col, min(col + tile_size, shape[1]))
+            )
+            window = tuple(
+                slice(max(s.start - halo, 0), min(s.stop + halo, n))
+                for s, n in zip(core, shape)
+            )
+            yield core, window
+
+
+def artifact_detector_tiled(pyramid,
+                            downscale=2,
+                            erosion_kernel_size=5,
+                            lower_quantile_cutoff=0.2,
+                            h=None,
+                            tile_size=2048,
+                            halo=None,
+                            n_jobs=-1,
+                            out=None):
+    """Tiled version of artifact_detector_v3 for pyramid levels too large to
+    process in one piece.
+
+    The intensity transform (rank filters) is computed chunk-wise with
+    dask's map_overlap, so it is identical to the untiled result, and the
+    global intensity range, lower quantile and automatic `h` are derived from
+    exact 8-bit histograms. Seeds and floods are then computed per tile over a
+    window padded by `halo` pixels: each tile keeps the seeds in its core,
+    picks their tolerances from fill curves within its window, and adds their
+    floods (which may extend into the halo) to the merged mask. Tiles run in a
+    thread pool.
+
+    Neither the transformed image nor the mask is held in memory: both are
+    written to the `transformed` and `mask` arrays of the zarr group at `out`
+    (e.g. a sample's ArtifactStore group; a temporary directory if None),
+    the mask one tile at a time as tiles complete.
+
+    Returns the same (artifact_mask, im_transformed, seeds, optimal_tols, h)
+    tuple as artifact_detector_v3, with the mask and transformed image as
+    zarr arrays.
+    """
+    kernel = disk(erosion_kernel_size)
+    kernel_large = disk(erosion_kernel_size*4)
+    if halo is None:
+        halo = tile_size // 4
+
+    level = pyramid[downscale].rechunk(tile_size)
+    vmin, vmax = da.compute(level.min(), level.max())
+    im = level.map_blocks(
+        rescale_intensity, in_range=(float(vmin), float(vmax)), out_range=np.uint8,
+        dtype=np.uint8
+    )
+    im_eroded = im.map_overlap(
+        lambda block: rank_min(block, kernel), depth=erosion_kernel_size,
+        boundary='none', dtype=np.uint8
+    )
+    counts = da.bincount(im_eroded.ravel(), minlength=256).compute()
+    lower_quantile = _histogram_quantile(counts, lower_quantile_cutoff)
+    im_eroded = da.maximum(im_eroded, np.uint8(lower_quantile))
+    if out is None:
+        out = os.path.join(tempfile.mkdtemp(), 'artifacts.zarr')
+    zarr.open_group(out, mode='a')
+    im_eroded.map_overlap(
+        lambda block: rank_max(mean(block, kernel), kernel), depth=2*erosion_kernel_size,
+        boundary='none', dtype=np.uint8
+    ).to_zarr(out, component='transformed', overwrite=True)
+    transformed = zarr.open_array(os.path.join(out, 'transformed'), mode='r')
+    im_transformed = da.from_zarr(transformed)
+
+    if h is None:
+        local_contrast = im_transformed.map_overlap(
+            lambda block: gradient(block, kernel_large), depth=4*erosion_kernel_size,
+            boundary='none', dtype=np.uint8
+        )
+        counts = da.bincount(local_contrast.ravel(), minlength=256).compute()
+        lower_quantile = _histogram_quantile(counts, 0.5)
+        values = np.flatnonzero(counts)
+        values = values[values > lower_quantile]
+        try:
+            if len(values) == 0:
+                raise RuntimeError
+            bin_centers = np.arange(values.min(), values.max() + 1)
+            h = skimage.filters.threshold_minimum(hist=(counts[bin_centers], bin_centers))
+        except RuntimeError:
+            h=255
+
+    def process_tile(core, window):
+        tile = transformed[window]
+        seeds, _ = _artifact_seeds(tile, h, kernel_large)
+        offset = np.array([window[0].start, window[1].start])
+        in_core = (
+            (seeds[:, 0] + offset[0] >= core[0].start) 
+            & (seeds[:, 0] + offset[0] < core[0].stop)
+            & (seeds[:, 1] + offset[1] >= core[1].start) 
+            & (seeds[:, 1] + offset[1] < core[1].stop)
+        )
+        seeds = seeds[in_core]
+        tols = _optimal_tolerances(tile, seeds)
+        return window, flood_fill_mask(tile, seeds, tols), seeds + offset, tols
+
+    artifact_mask = zarr.open_array(
+        os.path.join(out, 'mask'), mode='w', shape=transformed.shape,
+        chunks=(tile_size, tile_size), dtype=np.int16, fill_value=0
+    )
+
+    # merge tile masks as they complete so only tiles in flight are held in memory
+    all_seeds, all_tols = [np.empty((0, 2), dtype=int)], [np.empty(0, dtype=int)]
+    for window, tile_mask, seeds, tols in Parallel(
+            n_jobs=n_jobs, prefer='threads', return_as='generator_unordered')(
+            delayed(process_tile)(core, window) for core, window
+            in _tile_windows(transformed.shape, tile_size, halo)):
+        artifact_mask[window] = artifact_mask[window] + tile_mask
+        all_seeds.append(seeds)
+        all_tols.append(tols)
+    seeds = np.vstack(all_seeds).astype(int)
+    optimal_tols = np.concatenate(all_tols).astype(int)
+
+    return artifact_mask, transformed, seeds, optimal_tols, h
+
+
+def run_artifact_detector(pyramid, downscale=2, h=None, max_untiled_size=8192, out=None,
+                          n_jobs=-1):
+    """Run artifact_detector_v3, or its tiled version (writing to the zarr
+    group at `out`, processing tiles in `n_jobs` threads) if the pyramid level
+    is larger than max_untiled_size pixels along either axis."""
+    if max(pyramid[downscale].shape[-2:]) > max_untiled_size:
+        return artifact_detector_tiled(
+            pyramid, downscale=downscale, h=h, out=out, n_jobs=n_jobs
+        )
+    return artifact_detector_v3(pyramid, downscale=downscale, h=h)
+
+
+def detect_artifacts(tiff_path, channel, downscale=2, h=None, out=None, n_jobs=-1):
+    """Run classical artifact detection on one channel of an image file.
+
+    The image pyramid is opened here rather than passed in so that calls can
+    be dispatched to worker processes. The scale of the pyramid level that
+    was analyzed is appended to the detector's outputs.
+    """
+    pyramid, vmin, vmax = single_channel_pyramid(tiff_path, channel=channel)
+    return (
+        run_artifact_detector(pyramid, downscale=downscale, h=h, out=out, n_jobs=n_jobs)
+        + (pyramid_scale(pyramid, downscale),)
+    )
+
+
+def pyramid_scale(pyramid, level):
+    """Return the (row, col) factors mapping pyramid level coordinates to full resolution."""
+    return tuple(
+        float(full) / float(down) for full, down
+        in zip(pyramid[0].shape[-2:], pyramid[level].shape[-2:])
+    )
+
+
+def lookup_mask(mask, xs, ys, scale):
+    """Sample a downsampled mask at full-resolution (xs, ys) coordinates.
+
+    Coordinates are mapped into the mask's own resolution, which avoids
+    resizing the mask to the size of the full-resolution image.
+    """
+    # nearest-neighbour mapping of pixel centers, as in upscale()
+    rows = np.clip(
+        np.rint((np.asarray(ys) + 0.5) / scale[0] - 0.5).astype(np.int64),
+        0, mask.shape[0] - 1
+    )
+    cols = np.clip(
+        np.rint((np.asarray(xs) + 0.5) / scale[1] - 0.5).astype(np.int64),
+        0, mask.shape[1] - 1
+    )
+    if isinstance(mask, zarr.Array):
+        return mask.vindex[rows, cols]
+    return mask[rows, cols]
+
+
 def upscale(raw_im, target_im):
     return skimage.transform.resize(raw_im, target_im.shape,
                                      order=0, preserve_range=True, 
@@ -916,13 +1729,106 @@ class ArtifactInfo():
     features: pd.DataFrame = None
     artifact_layer: napari.layers.Image = None
     seed_layer: napari.layers.Points = None
+    fill_cache: Dict = field(default_factory=dict, repr=False)
+
+    @property
+    def scale(self):
+        # masks saved before 'scale' was recorded assume 2x pyramid levels
+        return tuple(self.params.get('scale', (2**self.params['downscale'],) * 2))
         
+    def mask_image(self):
+        """Binary artifact mask for display; lazy for masks stored in zarr."""
+        if isinstance(self.mask, zarr.Array):
+            return da.from_zarr(self.mask) > 0
+        return self.mask > 0
+
     def update_mask(self, new_mask):
         self.mask = new_mask
-        self.artifact_layer.data = upscale(self.mask, 
-                                           self.artifact_layer.data)
+        self.artifact_layer.data = self.mask_image()
+        self.artifact_layer.refresh()
+
+    def update_region(self, bbox):
+        """Push the bbox tile of the mask to the artifact layer."""
+        if self.artifact_layer is None:
+            return
+        if isinstance(self.mask, zarr.Array):
+            # lazy layer data cannot be written to; re-read it from the store
+            self.artifact_layer.data = self.mask_image()
+        else:
+            self.artifact_layer.data[bbox] = self.mask[bbox] > 0
         self.artifact_layer.refresh()
 
+    def fill(self, seed, tol):
+        """Return (bbox, crop) of the flood from seed at tolerance tol.
+
+        The flood is computed within a window around the seed that doubles in
+        size until the fill no longer touches its edge, so the cost scales with
+        the size of the filled region rather than the image. Results are cached
+        per (seed, tolerance).
+        """
+        key = (tuple(int(i) for i in seed), int(tol))
+        if key in self.fill_cache:
+            return self.fill_cache[key]
+
+        im = self.transformed
+        half = 32
+        while True:
+            window = tuple(
+                slice(max(c - half, 0), min(c + half + 1, n))
+                for c, n in zip(key[0], im.shape)
+            )
+            local = flood(
+                im[window], seed_point=tuple(c - w.start for c, w in zip(key[0], window)),
+                tolerance=tol
+            )
+            clipped = (
+                (local[0].any() and window[0].start > 0)
+                or (local[-1].any() and window[0].stop < im.shape[0])
+                or (local[:, 0].any() and window[1].start > 0)
+                or (local[:, -1].any() and window[1].stop < im.shape[1])
+            )
+            if not clipped:
+                break
+            half *= 2
+
+        rows, cols = np.nonzero(local)
+        bbox = (
+            slice(window[0].start + rows.min(), window[0].start + rows.max() + 1),
+            slice(window[1].start + cols.min(), window[1].start + cols.max() + 1)
+        )
+        crop = local[rows.min():rows.max() + 1, cols.min():cols.max() + 1]
+
+        if len(self.fill_cache) >= 512:
+            self.fill_cache.clear()
+        self.fill_cache[key] = (bbox, crop)
+        return bbox, crop
+
+    def add_fill(self, seed, tol, sign=1):
+        """Add (sign=1) or subtract (sign=-1) a seed's flood from the mask."""
+        bbox, crop = self.fill(seed, tol)
+        self.mask[bbox] += sign * crop.astype(self.mask.dtype)
+        self.update_region(bbox)
+
+    def change_tolerance(self, seed, old_tol, new_tol):
+        """Replace a seed's flood at old_tol by its flood at new_tol, touching
+        only the bounding box of the two fills."""
+        (old_bbox, old_crop), (new_bbox, new_crop) = (
+            self.fill(seed, old_tol), self.fill(seed, new_tol)
+        )
+        bbox = tuple(
+            slice(min(o.start, n.start), max(o.stop, n.stop))
+            for o, n in zip(old_bbox, new_bbox)
+        )
+        delta = np.zeros([s.stop - s.start for s in bbox], dtype=self.mask.dtype)
+        delta[tuple(
+            slice(n.start - b.start, n.stop - b.start) for n, b in zip(new_bbox, bbox)
+        )] += new_crop
+        delta[tuple(
+            slice(o.start - b.start, o.stop - b.start) for o, b in zip(old_bbox, bbox)
+        )] -= old_crop
+        self.mask[bbox] += delta
+        self.update_region(bbox)
+
     def bind_listener_seeds(self, viewer, global_state, tolerance_spinbox):
         seed_layer = self.seed_layer
         if seed_layer is None:
@@ -949,16 +1855,13 @@ class ArtifactInfo():
                 pt_id = uuid4()
                 df.loc[df.index[-1], 'id']=pt_id
                 df.loc[df.index[-1], 'tol']=0
-                seed = (current_layer.data[-1] / (2**current_layer.metadata['downscale'])).astype(int)
+                seed = (current_layer.data[-1] / np.array(artifact_info.scale)).astype(int)
                 artifact_info.seeds[pt_id] = seed
-                new_fill = flood(im_transformed, seed_point=tuple(seed), 
-                                                tolerance=0)
-                artifact_info.update_mask(artifact_info.mask + new_fill)
+                artifact_info.tols = np.append(artifact_info.tols, 0)
+                artifact_info.add_fill(seed, 0)
             elif event.action=='remove':
                 optimal_tol = global_state.current_tol
-                old_fill = flood(im_transformed, seed_point=tuple(global_state.current_point), 
-                                tolerance=optimal_tol) 
-                artifact_info.update_mask(artifact_info.mask - old_fill)
+                artifact_info.add_fill(global_state.current_point, optimal_tol, sign=-1)
         
         seed_layer.events.current_properties.connect(point_clicked_callback)
         seed_layer.events.data.connect(point_changed_callback)
@@ -968,11 +1871,11 @@ class ArtifactInfo():
             ids = list(self.seeds.keys())
         else:
             seeds = ids = []
-        self.seed_layer = viewer.add_points(seeds*(2**self.params['downscale']), 
+        self.seed_layer = viewer.add_points(seeds*np.array(self.scale), 
                         name=layer_name[abx_channel+'_seeds'],
                         face_color=[1,0,0,1],
                         edge_color=[0,0,0,0],
-                        size=int(max(*self.mask.shape) * (2**self.params['downscale']) / 100),
+                        size=int(max(*self.mask.shape) * max(self.scale) / 100),
                         features={
                             'id': ids,
                             'tol': self.tols
@@ -982,14 +1885,447 @@ class ArtifactInfo():
         self.seed_layer.metadata['downscale'] = self.params['downscale']
 
     def render_mask(self, viewer, loaded_ims, layer_name, abx_channel):
-        grayscale = upscale(self.mask > 0, loaded_ims[abx_channel][0])
-        self.artifact_layer = viewer.add_image(grayscale,
+        # display the mask at its own resolution, scaled onto the full-res image
+        scale = np.array(self.scale)
+        self.artifact_layer = viewer.add_image(self.mask_image(),
                                         name=layer_name[abx_channel+'_mask'], 
                                         opacity=0.5, visible=False,
-                                        blending='additive')
+                                        blending='additive',
+                                        scale=scale, translate=(scale - 1) / 2)
         self.artifact_layer.metadata['abx_channel'] = abx_channel
 
     def render(self, viewer, loaded_ims, layer_name, abx_channel):
         self.render_mask(viewer, loaded_ims, layer_name, abx_channel)
         self.render_seeds(viewer, loaded_ims, layer_name, abx_channel)
-        
\ No newline at end of file
+
+
+def _zarr_array_dir(array):
+    """Directory of a zarr array in a local store, or None."""
+    root = getattr(getattr(array, 'store', None), 'root', None)
+    if root is None:
+        return None
+    return os.path.realpath(os.path.join(str(root), array.path))
+
+
+class ArtifactStore(MutableMapping):
+    """Per-sample on-disk store of classical artifact detection results for one channel.
+
+    Each sample is written to its own chunked, compressed zarr group
+    (<root>/<sample>.zarr holding the `mask` and `transformed` arrays and
+    `params` attributes) and a small seed table (<root>/<sample>_seeds.csv with
+    columns id, row, col, tol), so saving one sample never rewrites the
+    others. Samples are read lazily on first access and cached; arrays larger
+    than IN_MEMORY_SIZE elements (e.g. written by artifact_detector_tiled)
+    stay in the zarr group and are edited there.
+    """
+
+    IN_MEMORY_SIZE = 8192 * 8192
+
+    def __init__(self, root):
+        self.root = root
+        self._cache = {}
+
+    def _paths(self, sample):
+        return (
+            os.path.join(self.root, f'{sample}.zarr'),
+            os.path.join(self.root, f'{sample}_seeds.csv')
+        )
+
+    def zarr_path(self, sample):
+        """Path of the sample's zarr group, e.g. as `out` for artifact_detector_tiled."""
+        return self._paths(sample)[0]
+
+    def __contains__(self, sample):
+        return sample in self._cache or os.path.exists(self._paths(sample)[1])
+
+    def __iter__(self):
+        suffix = '_seeds.csv'
+        return iter(sorted(
+            os.path.basename(path)[:-len(suffix)] for path
+            in glob.glob(os.path.join(glob.escape(self.root), f'*{suffix}'))
+        ))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __getitem__(self, sample):
+        if sample in self._cache:
+            return self._cache[sample]
+        zarr_path, seeds_path = self._paths(sample)
+        if not os.path.exists(seeds_path):
+            raise KeyError(sample)
+
+        group = zarr.open_group(zarr_path, mode='r+')
+        mask, transformed = group['mask'], group['transformed']
+        if mask.size <= self.IN_MEMORY_SIZE:
+            mask, transformed = mask[:], transformed[:]
+        table = pd.read_csv(seeds_path, dtype={'id': str})
+        ids = [int(i) if i.isdigit() else i for i in table['id']]
+        artifact_info = ArtifactInfo(
+            params=dict(group.attrs),
+            mask=mask,
+            transformed=transformed,
+            seeds=dict(zip(ids, table[['row', 'col']].to_numpy(dtype=int))),
+            tols=table['tol'].to_numpy(dtype=int)
+        )
+        self._cache[sample] = artifact_info
+        return artifact_info
+
+    def __setitem__(self, sample, artifact_info):
+        os.makedirs(self.root, exist_ok=True)
+        zarr_path, seeds_path = self._paths(sample)
+
+        arrays = {
+            'mask': artifact_info.mask, 'transformed': artifact_info.transformed
+        }
+        if not all(
+            _zarr_array_dir(array) == os.path.realpath(os.path.join(zarr_path, name))
+            for name, array in arrays.items()
+        ):
+            if any(isinstance(array, zarr.Array) for array in arrays.values()):
+                # copy zarr arrays stored elsewhere chunk by chunk
+                zarr.open_group(zarr_path, mode='w')
+                for name, array in arrays.items():
+                    da.from_array(array, chunks=2048).to_zarr(
+                        zarr_path, component=name, overwrite=True
+                    )
+            else:
+                zarr.save_group(
+                    zarr_path, mask=np.asarray(artifact_info.mask, dtype=np.int16),
+                    transformed=np.asarray(artifact_info.transformed)
+                )
+        zarr.open_group(zarr_path, mode='a').attrs.update(artifact_info.params)
+
+        # seeds added during fine-tuning start at zero tolerance
+        ids = list(artifact_info.seeds.keys())
+        tols = np.zeros(len(ids), dtype=int)
+        num_tols = min(len(ids), len(artifact_info.tols))
+        tols[:num_tols] = np.asarray(artifact_info.tols)[:num_tols]
+        coords = (
+            np.vstack(list(artifact_info.seeds.values())).astype(int) if ids
+            else np.empty((0, 2), dtype=int)
+        )
+        pd.DataFrame({
+            'id': [str(i) for i in ids], 'row': coords[:, 0], 'col': coords[:, 1],
+            'tol': tols
+        }).to_csv(seeds_path, index=False)
+
+        self._cache[sample] = artifact_info
+
+    def __delitem__(self, sample):
+        if sample not in self:
+            raise KeyError(sample)
+        zarr_path, seeds_path = self._paths(sample)
+        self._cache.pop(sample, None)
+        if os.path.exists(seeds_path):
+            os.remove(seeds_path)
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+
+    def import_pickle(self, pkl_path):
+        """Copy samples from a legacy <channel>_artifact_mask.pkl file into the store."""
+        with open(pkl_path, 'rb') as f:
+            legacy = pickle.load(f)
+        for sample, artifact_info in legacy.items():
+            self[sample] = ArtifactInfo(
+                artifact_info.params, artifact_info.mask, artifact_info.transformed,
+                artifact_info.seeds, artifact_info.tols
+            )
+
+
+_artifact_models = {}
+
+
+def file_hash(path, block_size=2**20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_detected_artifacts(store_root, sample, tiff_path, channel, downscale=2, n_jobs=1):
+    """Run detect_artifacts for one sample and write the result to the
+    ArtifactStore at `store_root`.
+
+    Meant for batch detection in worker processes: results are persisted by
+    the worker and only (store_root, sample) is sent back, so the parent never
+    holds the masks. The tiled detector runs its tiles in `n_jobs` threads
+    (one by default, as the workers already use every core).
+    """
+    store = ArtifactStore(store_root)
+    artifact_mask, im_transformed, seeds, tols, opt_h, scale = detect_artifacts(
+        tiff_path, channel=channel, downscale=downscale,
+        out=store.zarr_path(sample), n_jobs=n_jobs
+    )
+    store[sample] = ArtifactInfo(
+        {'downscale': downscale, 'scale': scale}, artifact_mask, im_transformed,
+        dict(zip(range(len(seeds)), seeds)), tols
+    )
+    return store_root, sample
+
+
+def load_artifact_model(model_path):
+    """Unpickle an artifact classifier once per process."""
+    if model_path not in _artifact_models:
+        with open(model_path, 'rb') as f:
+            _artifact_models[model_path] = pickle.load(f)
+    return _artifact_models[model_path]
+
+
+def predict_artifacts(clf, model_input, chunk_size=100000):
+    """Classify cells in chunks of rows to bound memory use.
+
+    Only predict_proba is evaluated; predicted classes are taken as the most
+    probable class, as clf.predict would return them.
+
+    Returns
+    -------
+    preds : ndarray
+        Predicted class per cell.
+    proba : ndarray
+        Class probabilities per cell (n_cells, n_classes).
+    """
+    proba = np.empty((len(model_input), len(clf.classes_)), dtype=float)
+    for start in range(0, len(model_input), chunk_size):
+        proba[start:start + chunk_size] = clf.predict_proba(
+            model_input.iloc[start:start + chunk_size]
+        )
+    return clf.classes_[np.argmax(proba, axis=1)], proba
+
+
+def score_artifacts(model_path, model_hash, model_input, cell_ids, cache_dir, sample):
+    """Return (preds, proba) for one sample, reading or writing the prediction cache.
+
+    Predictions are stored as <cache_dir>/<model_hash>/<sample>.npz together
+    with the CellIDs they were computed for, so a changed model or cell table
+    triggers recomputation.
+    """
+    cache_path = os.path.join(cache_dir, model_hash, f'{sample}.npz')
+    cell_ids = np.asarray(cell_ids)
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if np.array_equal(cached['cell_ids'], cell_ids):
+            return cached['preds'], cached['proba']
+
+    preds, proba = predict_artifacts(load_artifact_model(model_path), model_input)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez(cache_path, cell_ids=cell_ids, preds=preds, proba=proba)
+    return preds, proba
+
+
+def array_hash(array):
+    """Return the SHA-256 hex digest of an array's shape, dtype and values."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha256(f'{array.shape}{array.dtype}'.encode())
+    digest.update(array.data)
+    return digest.hexdigest()
+
+
+def embedding_key(data, channels, params):
+    """Return a hash identifying an embedding by its input cells (Sample and
+    CellID, in order), their values in the given channels, and the sampling
+    and algorithm parameters used to compute it."""
+    digest = hashlib.sha256(yaml.safe_dump(params, sort_keys=True).encode())
+    digest.update(yaml.safe_dump(list(channels)).encode())
+    digest.update(
+        pd.util.hash_pandas_object(data[['Sample', 'CellID']], index=False).to_numpy().data
+    )
+    digest.update(array_hash(data[channels].to_numpy()).encode())
+    return digest.hexdigest()
+
+
+def load_embedding(emb_dir, key):
+    """Return the embedding stored as <emb_dir>/embeddings/<key>.npy, or None.
+
+    The returned embedding is also copied to <emb_dir>/embedding.npy. An
+    embedding.npy written before embeddings were keyed cannot be matched to
+    its inputs and parameters, so it is not reused; it is kept as
+    embedding_legacy.npy rather than overwritten.
+    """
+    cache_dir = os.path.join(emb_dir, 'embeddings')
+    cache_path = os.path.join(cache_dir, f'{key}.npy')
+    current_path = os.path.join(emb_dir, 'embedding.npy')
+
+    if os.path.exists(cache_path):
+        embedding = np.load(cache_path)
+        np.save(current_path, embedding)
+        return embedding
+
+    if not os.path.exists(cache_dir) and os.path.exists(current_path):
+        logger.info(
+            'embedding.npy predates the embedding cache and cannot be matched to the '
+            'current data and parameters; keeping it as embedding_legacy.npy and '
+            're-embedding.'
+        )
+        os.replace(current_path, os.path.join(emb_dir, 'embedding_legacy.npy'))
+
+    return None
+
+
+def save_embedding(emb_dir, key, embedding, params):
+    """Store an embedding as <emb_dir>/embeddings/<key>.npy next to a YAML
+    record of its parameters, and as the current <emb_dir>/embedding.npy."""
+    cache_dir = os.path.join(emb_dir, 'embeddings')
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, f'{key}.npy'), embedding)
+    with open(os.path.join(cache_dir, f'{key}.yml'), 'w') as f:
+        yaml.safe_dump(params, f)
+    np.save(os.path.join(emb_dir, 'embedding.npy'), embedding)
+
+
+def knn_graph(X, cache_dir, key, n_neighbors, random_state=None):
+    """Return UMAP's precomputed_knn for an input matrix and the random state
+    to run UMAP with, reading or writing <cache_dir>/knn/<key>.npz.
+
+    The k-nearest-neighbour graph depends only on the input data, n_neighbors,
+    the (euclidean) input metric and the random state, so layout parameters
+    such as min_dist or repulsion_strength can change without recomputing it.
+    UMAP draws its layout randomness from the RandomState that NN-descent has
+    already advanced, so that state is stored with the graph and returned as
+    a RandomState: passing both to UMAP reproduces the embedding computed
+    without a precomputed graph. UMAP computes exact distances for fewer than
+    4096 cells and ignores a precomputed graph, so none is built for those.
+    """
+    if len(X) < 4096:
+        return (None, None, None), random_state
+
+    cache_path = os.path.join(cache_dir, 'knn', f'{key}.npz')
+    cached = np.load(cache_path, allow_pickle=False) if os.path.exists(cache_path) else None
+    if cached is not None and 'rng_keys' in cached.files:
+        indices, dists = cached['indices'], cached['dists']
+        rng_state = (
+            'MT19937', cached['rng_keys'], int(cached['rng_pos']),
+            int(cached['rng_has_gauss']), float(cached['rng_cached_gaussian'])
+        )
+    else:
+        rng = check_random_state(random_state)
+        indices, dists, _ = nearest_neighbors(
+            np.asarray(X), n_neighbors, 'euclidean', {}, False, rng, low_memory=False,
+            n_jobs=-1 if random_state is None else 1
+        )
+        rng_state = rng.get_state()
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        np.savez(
+            cache_path, indices=indices, dists=dists, rng_keys=rng_state[1],
+            rng_pos=rng_state[2], rng_has_gauss=rng_state[3],
+            rng_cached_gaussian=rng_state[4]
+        )
+
+    if random_state is None:
+        return (indices, dists, None), None
+    rng = np.random.RandomState()
+    rng.set_state(rng_state)
+    return (indices, dists, None), rng
+
+
+def compute_hdbscan_tree(X, min_samples, core_dist_n_jobs=-1):
+    """Return HDBSCAN's single-linkage tree (core distances and minimum
+    spanning tree of the mutual reachability graph) for an embedding."""
+    return hdbscan.HDBSCAN(
+        min_cluster_size=max(min_samples, 2),
+        min_samples=min_samples,
+        metric='euclidean', alpha=1.0, p=None,
+        algorithm='best', leaf_size=40,
+        approx_min_span_tree=True,
+        gen_min_span_tree=False,
+        core_dist_n_jobs=core_dist_n_jobs,
+        cluster_selection_method='eom',
+        allow_single_cluster=False,
+        prediction_data=False,
+        match_reference_implementation=False).fit(X).single_linkage_tree_.to_numpy()
+
+
+def condense_hdbscan_tree(tree, min_cluster_size):
+    """Return HDBSCAN cluster labels from a single-linkage tree condensed at
+    min_cluster_size."""
+    return _tree_to_labels(
+        None, tree, min_cluster_size=min_cluster_size,
+        cluster_selection_method='eom', allow_single_cluster=False)[0]
+
+
+def hdbscan_tree(X, cache_dir, min_samples):
+    """Return HDBSCAN's single-linkage tree for an embedding, reading or writing
+    <cache_dir>/hdbscan_tree_ms<min_samples>.npz.
+
+    The tree depends on min_samples but not on min_cluster_size, so one file
+    is kept per min_samples value, together with the embedding's hash, and
+    only recomputed when the embedding changes.
+    """
+    X = np.asarray(X)
+    key = array_hash(X)
+    cache_path = os.path.join(cache_dir, f'hdbscan_tree_ms{min_samples}.npz')
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if str(cached['key']) == key:
+            return cached['tree']
+
+    tree = compute_hdbscan_tree(X, min_samples)
+    np.savez(cache_path, tree=tree, key=key)
+    return tree
+
+
+def hdbscan_labels(X, cache_dir, min_cluster_size, min_samples=None):
+    """Cluster an embedding with HDBSCAN by condensing its cached single-linkage
+    tree at min_cluster_size.
+
+    As in hdbscan.HDBSCAN, min_samples defaults to min_cluster_size, in which
+    case each new min_cluster_size needs a new tree, so it is built in memory
+    and not cached; a fixed min_samples lets every min_cluster_size reuse the
+    same cached one.
+    """
+    if min_samples is None:
+        tree = compute_hdbscan_tree(np.asarray(X), min_cluster_size)
+    else:
+        tree = hdbscan_tree(X, cache_dir, min_samples)
+    return condense_hdbscan_tree(tree, min_cluster_size)
+
+
+def mcs_quality(X, tree, min_cluster_size, sample_size=10000, random_state=0):
+    """Cluster an embedding at one min_cluster_size and summarize the result.
+
+    If tree is None, it is built with min_samples = min_cluster_size. The
+    silhouette score is estimated from at most sample_size clustered cells
+    so that each call has a bounded cost (NaN if that subsample happens to
+    contain a single cluster).
+    """
+    start = perf_counter()
+    if tree is None:
+        tree = compute_hdbscan_tree(X, min_cluster_size, core_dist_n_jobs=1)
+    labels = condense_hdbscan_tree(tree, min_cluster_size)
+
+    clustered = labels != -1
+    n_clusters = len(np.unique(labels[clustered]))
+    silhouette = np.nan
+    if n_clusters > 1:
+        try:
+            silhouette = silhouette_score(
+                X[clustered], labels[clustered],
+                sample_size=min(sample_size, clustered.sum()), random_state=random_state
+            )
+        except ValueError:
+            # the random subsample drew a single cluster
+            pass
+
+    return {
+        'MCS': min_cluster_size, 'clusters': n_clusters,
+        'noise_fraction': 1 - clustered.mean(), 'silhouette': silhouette,
+        'runtime_s': perf_counter() - start
+    }
+
+
+def mcs_sweep(X, cache_dir, mcs_values, min_samples=None, sample_size=10000, n_jobs=-1):
+    """Summarize HDBSCAN clusterings of an embedding over a range of minimum
+    cluster sizes, one MCS per worker process.
+
+    With a fixed min_samples, all workers condense the same cached tree;
+    otherwise each builds its own. Returns one row per MCS (clusters, noise
+    fraction, silhouette estimate and runtime in seconds).
+    """
+    X = np.ascontiguousarray(X)
+    tree = None if min_samples is None else hdbscan_tree(X, cache_dir, min_samples)
+    rows = Parallel(n_jobs=n_jobs)(
+        delayed(mcs_quality)(X, tree, mcs, sample_size) for mcs in mcs_values
+    )
+    return pd.DataFrame(rows)
@@ -0,0 +1,45 @@
+import numpy as np
+from skimage.morphology import flood
+
+from cylinter.utils import flood_fill_areas, flood_fill_mask
+
+
+def _synthetic_image(seed=0, shape=(64, 64)):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    im = np.zeros(shape)
+    for _ in range(6):
+        cy, cx = rng.uniform(0, shape[0]), rng.uniform(0, shape[1])
+        im += rng.uniform(40, 120) * np.exp(
+            -((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * rng.uniform(4, 12) ** 2))
+    im += rng.uniform(0, 20, shape)
+    return np.clip(im, 0, 255).astype(np.uint8)
+
+
+def test_flood_fill_areas_matches_flood():
+    im = _synthetic_image()
+    rng = np.random.default_rng(1)
+    seeds = rng.integers(0, im.shape[0], (40, 2))
+    tolerances = np.arange(0, 60, 3)
+
+    areas = flood_fill_areas(im, seeds, tolerances)
+
+    expected = np.array([
+        [np.count_nonzero(flood(im, seed_point=tuple(s), tolerance=int(t)))
+         for t in tolerances] for s in seeds
+    ])
+    np.testing.assert_array_equal(areas, expected)
+
+
+def test_flood_fill_mask_matches_flood():
+    im = _synthetic_image(seed=2)
+    rng = np.random.default_rng(3)
+    seeds = rng.integers(0, im.shape[0], (30, 2))
+    tolerances = rng.integers(0, 60, len(seeds))
+
+    mask = flood_fill_mask(im, seeds, tolerances)
+
+    expected = np.zeros(im.shape, dtype=np.int16)
+    for s, t in zip(seeds, tolerances):
+        expected += flood(im, seed_point=tuple(s), tolerance=int(t))
+    np.testing.assert_array_equal(mask, expected)